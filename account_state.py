@@ -0,0 +1,96 @@
+from config import logger
+
+# Request IDs reserved for account streams
+ACCOUNT_SUMMARY_REQ_ID = 9001
+PNL_REQ_ID = 9002
+
+# Only the tags position sizing and margin checks need
+ACCOUNT_TAGS = [
+    "NetLiquidation",
+    "AvailableFunds",
+    "ExcessLiquidity",
+    "InitMarginReq",
+    "MaintMarginReq",
+]
+
+
+class AccountState:
+    """In-memory cache of account values, positions and PnL kept current by IB streams"""
+
+    def __init__(self, client):
+        self.client = client
+        self.account = None
+        self.values = {}     # tag -> float
+        self.currency = None
+        self.positions = {}  # symbol -> {"quantity", "avg_cost"}
+        self.pnl = {"daily": None, "unrealized": None, "realized": None}
+        self.subscribed = False
+
+    def subscribe(self):
+        """Subscribe to the account summary tags, positions and (once the account is known) PnL"""
+        self.client.reqAccountSummary(ACCOUNT_SUMMARY_REQ_ID, "All", ",".join(ACCOUNT_TAGS))
+        self.client.reqPositions()
+        if self.account:
+            self.client.reqPnL(PNL_REQ_ID, self.account, "")
+        self.subscribed = True
+        logger.info(f"Subscribed to account state: {', '.join(ACCOUNT_TAGS)}, positions, PnL")
+
+    def unsubscribe(self):
+        """Cancel all account streams"""
+        if not self.subscribed:
+            return
+        self.client.cancelAccountSummary(ACCOUNT_SUMMARY_REQ_ID)
+        self.client.cancelPositions()
+        if self.account:
+            self.client.cancelPnL(PNL_REQ_ID)
+        self.subscribed = False
+
+    # --- Stream handlers (called from the IB callback thread) ---
+
+    def on_managed_accounts(self, accounts_list):
+        """Remember the account and start PnL once it is known"""
+        accounts = [a for a in accounts_list.split(",") if a]
+        if not accounts:
+            return
+        first_time = self.account is None
+        self.account = accounts[0]
+        if first_time and self.subscribed:
+            self.client.reqPnL(PNL_REQ_ID, self.account, "")
+
+    def on_account_summary(self, tag, value, currency):
+        """Update a single account summary value"""
+        try:
+            self.values[tag] = float(value)
+            if currency:
+                self.currency = currency
+        except (TypeError, ValueError):
+            logger.warning(f"Ignoring non-numeric account value {tag}={value}")
+
+    def on_position(self, contract, position, avg_cost):
+        """Update the position for a contract"""
+        sym = f"{contract.symbol}{contract.currency}" if contract.secType == "CASH" else contract.symbol
+        if position == 0:
+            self.positions.pop(sym, None)
+        else:
+            self.positions[sym] = {"quantity": float(position), "avg_cost": float(avg_cost)}
+
+    def on_pnl(self, daily_pnl, unrealized_pnl, realized_pnl):
+        """Update account PnL"""
+        self.pnl = {"daily": daily_pnl, "unrealized": unrealized_pnl, "realized": realized_pnl}
+
+    # --- O(1) reads ---
+
+    def get_value(self, tag, default=None):
+        """Get the latest value for an account tag"""
+        return self.values.get(tag, default)
+
+    def net_liquidation(self, default=None):
+        return self.values.get("NetLiquidation", default)
+
+    def available_funds(self, default=None):
+        return self.values.get("AvailableFunds", default)
+
+    def get_position(self, symbol):
+        """Get the signed position quantity for a symbol (0 when flat)"""
+        pos = self.positions.get(symbol)
+        return pos["quantity"] if pos else 0.0
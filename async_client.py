@@ -0,0 +1,286 @@
+import asyncio
+from threading import Lock
+import pandas as pd
+from config import logger, TIMEFRAMES, ASYNC_REQ_ID_BASE, ASYNC_REQ_ID_RANGE
+from account_state import ACCOUNT_TAGS
+from bar_archive import ARCHIVE_COLUMNS, bar_time_to_epoch
+from historical_data_manager import DEFAULT_DURATIONS
+from scheduler import PRIORITY_BACKFILL
+
+# Notices IB sends with a request id that do not mean the request failed
+WARNING_CODES = frozenset([399, 2104, 2106, 2107, 2108, 2158])
+TERMINAL_STATUSES = frozenset(["Filled", "Cancelled", "ApiCancelled", "Inactive"])
+
+
+class IBRequestError(Exception):
+    """IB answered a request with an error"""
+
+    def __init__(self, reqId, errorCode, errorString):
+        super().__init__(f"Request {reqId} failed: {errorCode} {errorString}")
+        self.reqId = reqId
+        self.errorCode = errorCode
+        self.errorString = errorString
+
+
+class AsyncClient:
+    """
+    asyncio facade over IBConnection.
+
+    Requests are sent as usual (through the request scheduler where IB paces them) and
+    return futures of the calling event loop. The IB reader thread collects the callback
+    data and resolves each future with loop.call_soon_threadsafe when the request ends,
+    so many requests can be fanned out with asyncio.gather. Cancelling an await cancels
+    the request at IB (or drops it from the scheduler queue if it was not sent yet).
+
+    Request ids come from their own range; IBConnection hands callbacks for them here.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.lock = Lock()
+        self.jobs = {}           # reqId -> {"future", "kind", "rows"}
+        self.orders = {}         # orderId -> {"future", "until"}
+        self.stream_waiters = {}  # keepUpToDate stream reqId -> futures waiting for its history
+        self.loaded = set()      # stream reqIds whose initial history has arrived
+        self.next_id = 0
+
+    # --- Requests ---
+
+    async def historical_data(self, symbol, timeframe, duration=None, end="", what_to_show="MIDPOINT",
+                              priority=PRIORITY_BACKFILL):
+        """
+        One-shot historical bars.
+        Args:
+            symbol (str): Currency pair (e.g. 'EURUSD')
+            timeframe (str): One of TIMEFRAMES keys from config
+            duration (str): IBKR duration string; defaults to the stream's DEFAULT_DURATIONS
+            end (str): IBKR endDateTime ("" for now)
+        Returns:
+            DataFrame of open/high/low/close/volume indexed by bar open time in epoch seconds
+        """
+        req_id, future = self._open("historical")
+        key = ("async", req_id)
+
+        def send():
+            self.connection.reqHistoricalData(
+                reqId=req_id,
+                contract=self.connection.contracts.get(symbol),
+                endDateTime=end,
+                durationStr=duration or DEFAULT_DURATIONS.get(timeframe, "1 M"),
+                barSizeSetting=TIMEFRAMES[timeframe],
+                whatToShow=what_to_show,
+                useRTH=1,
+                formatDate=1,
+                keepUpToDate=False,
+                chartOptions=[]
+            )
+
+        self.connection.scheduler.submit("historical", key, send, priority, contract_key=symbol)
+
+        def cancel():
+            if self.connection.scheduler.cancel(key):
+                self.connection.cancelHistoricalData(req_id)
+
+        rows = await self._wait(req_id, future, cancel)
+        df = pd.DataFrame(rows, columns=ARCHIVE_COLUMNS)
+        return df.drop_duplicates("time", keep="last").set_index("time")
+
+    async def history(self, symbols, timeframe, **kwargs):
+        """historical_data for several symbols at once; returns {symbol: DataFrame}"""
+        frames = await asyncio.gather(*(self.historical_data(sym, timeframe, **kwargs) for sym in symbols))
+        return dict(zip(symbols, frames))
+
+    async def contract_details(self, symbol):
+        """All ContractDetails IB returns for a symbol"""
+        req_id, future = self._open("contract_details")
+        key = ("async", req_id)
+        contract = self.connection.contracts.get(symbol)
+        self.connection.scheduler.submit("contract_details", key,
+                                         lambda: self.connection.reqContractDetails(req_id, contract))
+        return await self._wait(req_id, future, lambda: self.connection.scheduler.cancel(key))
+
+    async def account_summary(self, tags=ACCOUNT_TAGS, group="All"):
+        """
+        Snapshot of account values. IB allows only two summary subscriptions at a time
+        (AccountState holds one), so do not run several of these concurrently.
+        Returns:
+            {tag: float} (non-numeric values are kept as strings)
+        """
+        req_id, future = self._open("account_summary")
+        self.connection.reqAccountSummary(req_id, group, ",".join(tags))
+        try:
+            return await self._wait(req_id, future, lambda: None)
+        finally:
+            self.connection.cancelAccountSummary(req_id)
+
+    async def place_order(self, contract, order, until=("PreSubmitted", "Submitted", "Filled")):
+        """
+        Send an order and wait for the first status in `until` (or a terminal status).
+        Cancelling the await cancels the order.
+        Returns:
+            {"order_id", "status", "filled", "remaining", "avg_fill_price"}
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if not order.orderId:
+            # Shares OrderManager's allocator so strategy orders never get the same ID
+            order.orderId = self.connection.order_manager.next_order_id()
+        order_id = order.orderId
+        with self.lock:
+            self.orders[order_id] = {"future": future, "until": frozenset(until) | TERMINAL_STATUSES}
+        self.connection.placeOrder(order_id, contract, order)
+        try:
+            return await future
+        except asyncio.CancelledError:
+            self.connection.cancelOrder(order_id)
+            raise
+        finally:
+            with self.lock:
+                self.orders.pop(order_id, None)
+
+    async def subscribe_bars(self, symbol, timeframe):
+        """Open the DataHandler's keepUpToDate stream for a symbol and wait for its initial history"""
+        req_id = self.connection.historical_data._generate_request_id(symbol, timeframe)
+        with self.lock:
+            if req_id in self.loaded:
+                return
+            future = asyncio.get_running_loop().create_future()
+            self.stream_waiters.setdefault(req_id, []).append(future)
+        if not self.connection.historical_data.is_subscribed(symbol, timeframe):
+            self.connection.historical_data.subscribe_bars(symbol, timeframe)
+        try:
+            await future
+        finally:
+            with self.lock:
+                waiters = self.stream_waiters.get(req_id, [])
+                if future in waiters:
+                    waiters.remove(future)
+
+    # --- Callbacks (IB reader thread) ---
+
+    def owns(self, reqId):
+        return ASYNC_REQ_ID_BASE <= reqId < ASYNC_REQ_ID_BASE + ASYNC_REQ_ID_RANGE
+
+    def on_bar(self, reqId, bar):
+        job = self.jobs.get(reqId)
+        if job is not None:
+            job["rows"].append((bar_time_to_epoch(bar.date), bar.open, bar.high, bar.low, bar.close,
+                                bar.volume if hasattr(bar, 'volume') else 0))
+
+    def on_contract_details(self, reqId, details):
+        job = self.jobs.get(reqId)
+        if job is not None:
+            job["rows"].append(details)
+
+    def on_account_summary(self, reqId, tag, value):
+        job = self.jobs.get(reqId)
+        if job is None:
+            return
+        try:
+            job["rows"][tag] = float(value)
+        except (TypeError, ValueError):
+            job["rows"][tag] = value
+
+    def on_end(self, reqId):
+        """A request finished: hand its collected data to the awaiting coroutine"""
+        with self.lock:
+            job = self.jobs.pop(reqId, None)
+        if job is None:
+            return
+        if job["kind"] != "account_summary":
+            self.connection.scheduler.complete(("async", reqId))
+        _resolve(job["future"], result=job["rows"])
+
+    def on_stream_loaded(self, reqId):
+        """Initial history of a keepUpToDate stream arrived"""
+        with self.lock:
+            self.loaded.add(reqId)
+            waiters = self.stream_waiters.pop(reqId, [])
+        for future in waiters:
+            _resolve(future, result=None)
+
+    def on_order_status(self, orderId, status, filled, remaining, avgFillPrice):
+        with self.lock:
+            pending = self.orders.get(orderId)
+            if pending is None or status not in pending["until"]:
+                return
+            del self.orders[orderId]
+        _resolve(pending["future"], result={
+            "order_id": orderId, "status": status, "filled": filled,
+            "remaining": remaining, "avg_fill_price": avgFillPrice,
+        })
+
+    def on_error(self, reqId, errorCode, errorString):
+        """Fail the request or order the error belongs to; pacing violations are re-queued"""
+        if errorCode in WARNING_CODES:
+            return
+        with self.lock:
+            pending = self.orders.pop(reqId, None)
+        if pending is not None:
+            _resolve(pending["future"], error=IBRequestError(reqId, errorCode, errorString))
+            return
+        if not self.owns(reqId) or reqId not in self.jobs:
+            return
+        key = ("async", reqId)
+        if errorCode == 162 and "pacing" in errorString.lower():
+            self.jobs[reqId]["rows"] = []
+            self.connection.scheduler.retry(key)
+            return
+        with self.lock:
+            job = self.jobs.pop(reqId, None)
+        if job is None:
+            return
+        self.connection.scheduler.complete(key)
+        _resolve(job["future"], error=IBRequestError(reqId, errorCode, errorString))
+
+    def restart_in_flight(self):
+        """After a reconnect, requests that were in flight are lost; fail them so callers can retry"""
+        with self.lock:
+            jobs = list(self.jobs.items())
+            self.jobs.clear()
+            self.loaded.clear()
+        for req_id, job in jobs:
+            self.connection.scheduler.complete(("async", req_id))
+            _resolve(job["future"], error=ConnectionError(f"Connection lost during request {req_id}"))
+
+    # --- Helpers ---
+
+    def _open(self, kind):
+        """Allocate a request id and a future on the running loop"""
+        future = asyncio.get_running_loop().create_future()
+        with self.lock:
+            req_id = ASYNC_REQ_ID_BASE + self.next_id % ASYNC_REQ_ID_RANGE
+            self.next_id += 1
+            self.jobs[req_id] = {"future": future, "kind": kind, "rows": {} if kind == "account_summary" else []}
+        return req_id, future
+
+    async def _wait(self, req_id, future, cancel):
+        """Await a request's future; if the await is cancelled, cancel the request too"""
+        try:
+            return await future
+        except asyncio.CancelledError:
+            with self.lock:
+                active = self.jobs.pop(req_id, None) is not None
+            if active:
+                try:
+                    cancel()
+                except Exception as e:
+                    logger.error(f"Error cancelling request {req_id}: {str(e)}")
+            raise
+
+
+def _resolve(future, result=None, error=None):
+    """Complete a future from any thread, unless its await was already cancelled"""
+    def settle():
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    try:
+        future.get_loop().call_soon_threadsafe(settle)
+    except RuntimeError:
+        # Event loop already closed; nobody is waiting any more
+        pass
@@ -0,0 +1,83 @@
+from threading import Lock
+import os
+import time
+import pandas as pd
+from config import logger, BAR_ARCHIVE_DIR
+
+ARCHIVE_COLUMNS = ["time", "open", "high", "low", "close", "volume"]
+
+
+def bar_time_to_epoch(date):
+    """
+    IB bar date as UTC epoch seconds. Accepts formatDate=2 epoch strings, "yyyymmdd",
+    "yyyymmdd hh:mm:ss <timezone>" and "yyyymmdd hh:mm:ss" (TWS local time, which is
+    taken to be this host's time zone).
+    """
+    text = str(date).strip()
+    if text.isdigit() and len(text) > 8:
+        return int(text)
+    parts = text.split()
+    if len(parts) == 3:
+        return pd.Timestamp(" ".join(parts[:2])).tz_localize(parts[2]).value // 10**9
+    if len(parts) == 2:
+        return int(time.mktime(pd.Timestamp(text).timetuple()))
+    return pd.Timestamp(text).value // 10**9
+
+
+class BarArchive:
+    """
+    Append-only OHLCV history on disk, one CSV per symbol and timeframe.
+
+    Rows are keyed by bar open time in epoch seconds. Writers only ever append, so the
+    same bar may appear more than once (e.g. re-sent after a reconnect); read() sorts
+    by time and keeps the last copy of each bar.
+    """
+
+    def __init__(self, directory=BAR_ARCHIVE_DIR):
+        self.directory = directory
+        self.lock = Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, symbol, timeframe):
+        return os.path.join(self.directory, f"{symbol}_{timeframe}_bars.csv")
+
+    def append(self, symbol, timeframe, rows):
+        """
+        Append bars to the archive.
+        Args:
+            rows (iterable): (epoch seconds, open, high, low, close, volume) tuples
+        """
+        lines = "".join(
+            f"{int(t)},{o!r},{h!r},{l!r},{c!r},{v!r}\n"
+            for t, o, h, l, c, v in ((row[0], *map(float, row[1:])) for row in rows)
+        )
+        if not lines:
+            return
+        path = self.path(symbol, timeframe)
+        try:
+            with self.lock:
+                new_file = not os.path.exists(path)
+                with open(path, "a") as f:
+                    if new_file:
+                        f.write(",".join(ARCHIVE_COLUMNS) + "\n")
+                    f.write(lines)
+        except Exception as e:
+            logger.error(f"Error archiving bars for {symbol} {timeframe}: {str(e)}")
+
+    def read(self, symbol, timeframe, start=None, end=None):
+        """Archived bars as a frame indexed by epoch seconds, sorted and de-duplicated"""
+        path = self.path(symbol, timeframe)
+        if not os.path.exists(path):
+            return pd.DataFrame(columns=ARCHIVE_COLUMNS[1:], dtype=float)
+        df = pd.read_csv(path, dtype={"time": "int64"}, on_bad_lines="skip")
+        df = df.drop_duplicates("time", keep="last").sort_values("time", kind="stable").set_index("time")
+        if start is not None:
+            df = df[df.index >= start]
+        if end is not None:
+            df = df[df.index < end]
+        return df
+
+    def last_time(self, symbol, timeframe):
+        """Open time of the newest archived bar, or None"""
+        df = self.read(symbol, timeframe)
+        return int(df.index[-1]) if len(df) else None
@@ -1,55 +1,33 @@
-from threading import Thread
+import asyncio
 import time
-from ibapi.account_summary_tags import AccountSummaryTags
 
-from config import logger
-from connection import IBConnection, run_loop
+from config import logger, METRICS_PORT, ASYNC_MAIN, SYMBOLS, TIMEFRAMES
+from connection import IBConnection
+from session import SessionManager
+
+# TWS connection used by both main() and main_async()
+# HOST = IB_HOST if IB_HOST else "127.0.0.1"
+HOST = "127.0.0.1"
+PORT = 7497
+CLIENT_ID = 0
 
 
 def main():
     # Instantiate the connection
     app = IBConnection()
+    app.profiler.install_signal_handlers()
+    if METRICS_PORT:
+        app.metrics.serve()
     
     try:
-        # Connect using environment variables                                                       
-        # host = IB_HOST if IB_HOST else "127.0.0.1"
-        host = "127.0.0.1"
-        port = 7497
-        
-        # Add retry logic for connection
-        max_retries = 5
-        retry_count = 0
-        connected = False
-        
-        while retry_count < max_retries and not connected:
-            try:
-                logger.info(f"Connecting to {host}:{port} (Attempt {retry_count + 1}/{max_retries})")
-                app.connect(host, port, clientId=0)
-                
-                # Start the application's event loop in a thread
-                api_thread = Thread(target=run_loop, args=(app,), daemon=True)
-                api_thread.start()
-                
-                # Wait until the connection is ready
-                if app.connection_ready.wait(30):
-                    connected = True
-                    logger.info("Successfully connected to IB API")
-                else: 
-                    logger.warning("Connection timeout. Retrying...")
-                    retry_count += 1
-                    time.sleep(10)  # Wait before retry
-            except Exception as e:
-                logger.error(f"Connection error: {str(e)}")
-                retry_count += 1
-                time.sleep(10)  # Wait before retry
-        
-        if not connected:
-            logger.error("Failed to connect after maximum retries. Exiting.")
+        # Connect, reconnecting with backoff and restoring state whenever the session drops
+        session = SessionManager(app, HOST, PORT, client_id=CLIENT_ID)
+        if not session.start():
+            logger.error("Failed to connect. Exiting.")
             return
         
-        # Request account summary
-        logger.info("Requesting account summary")
-        app.reqAccountSummary(0, "All", AccountSummaryTags.AllTags)
+        # Stream the account values, positions and PnL used for sizing
+        app.account_state.subscribe()
         
         # Keep the main thread running
         try:
@@ -60,14 +38,97 @@ def main():
         except KeyboardInterrupt:
             logger.info("Keyboard interrupt detected. Shutting down...")
         
-        # Disconnect
-        app.disconnect()
-        logger.info("Bot shutdown complete")
+        shutdown(app, session)
         
     except Exception as e:
         logger.error(f"Error in main function: {str(e)}")
         if app:
             app.disconnect()
 
+
+async def main_async():
+    """main() as one asyncio event loop: the strategy runs as a task instead of a thread"""
+    # A full trading session whose strategy runs as a task, not the nextValidId thread
+    app = IBConnection(threaded_strategy=False)
+    app.profiler.install_signal_handlers()
+    if METRICS_PORT:
+        app.metrics.serve()
+    loop = asyncio.get_running_loop()
+    
+    try:
+        session = SessionManager(app, HOST, PORT, client_id=CLIENT_ID)
+        if not await loop.run_in_executor(None, session.start):
+            logger.error("Failed to connect. Exiting.")
+            return
+        app.account_state.subscribe()
+        
+        strategy = asyncio.create_task(run_strategy_async(app))
+        try:
+            # Block until app.done is set or Ctrl-C cancels this task, without polling
+            await loop.run_in_executor(None, app.done.wait)
+        except asyncio.CancelledError:
+            logger.info("Keyboard interrupt detected. Shutting down...")
+        finally:
+            strategy.cancel()
+            app.done.set()  # releases the executor thread waiting above
+        
+        shutdown(app, session)
+        
+    except Exception as e:
+        logger.error(f"Error in main function: {str(e)}")
+        app.disconnect()
+
+
+async def run_strategy_async(app):
+    """Strategy loop on the event loop, one cycle at the start of every minute"""
+    loop = asyncio.get_running_loop()
+    logger.info("Starting trading strategy (asyncio)")
+    
+    while True:
+        try:
+            # 1. Open missing bar streams and wait until their history has arrived
+            streams = [app.async_client.subscribe_bars(sym, tf) for sym in SYMBOLS for tf in TIMEFRAMES]
+            try:
+                await asyncio.wait_for(asyncio.gather(*streams), timeout=30)
+            except asyncio.TimeoutError:
+                logger.warning("Not all bar streams loaded within 30s, running on the data available")
+            
+            # 2. Evaluate all strategies off the loop (indicator and order work blocks)
+            cycle_start = time.perf_counter()
+            await loop.run_in_executor(None, app.strategies.run_cycle)
+            app.metrics.observe_cycle(time.perf_counter() - cycle_start)
+            
+            # 3. Sleep to the next minute boundary rather than a fixed 60s after the cycle
+            logger.info("Completed strategy iteration, waiting for next cycle")
+            await asyncio.sleep(60 - time.time() % 60)
+        
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in strategy execution: {str(e)}")
+            await asyncio.sleep(30)  # Wait before retrying
+
+
+def shutdown(app, session):
+    """Disconnect and release everything main() started"""
+    app.done.set()  # stops background watchers tied to it
+    session.stop()
+    app.profiler.disable()
+    app.metrics.stop()
+    app.strategies.shutdown()
+    app.data_handler.flush()
+    if app.data_handler.publisher is not None:
+        app.data_handler.publisher.close()
+    if app.recorder is not None:
+        app.recorder.close()
+    logger.info("Bot shutdown complete")
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if ASYNC_MAIN:
+        try:
+            asyncio.run(main_async())
+        except KeyboardInterrupt:
+            pass
+    else:
+        main()
@@ -11,6 +11,46 @@ IB_PASSWORD = os.getenv("IB_PASSWORD")
 IB_HOST = os.getenv("IB_HOST", "127.0.0.1")
 PORT = int(os.getenv("PORT", "7496"))  # Updated to match your TWS port
 
+# Reconnect backoff (seconds)
+RECONNECT_BACKOFF_INITIAL = 1
+RECONNECT_BACKOFF_MAX = 30
+CONNECT_MAX_ATTEMPTS = 10  # consecutive failed attempts before giving up (0 retries forever)
+
+# Resolved contract cache
+CONTRACT_CACHE_PATH = "contract_cache.json"
+CONTRACT_CACHE_MAX_AGE_DAYS = 7
+
+# IB pacing limits: class -> (requests, window seconds); window 0 means a concurrent cap
+PACING_LIMITS = {
+    "historical": (60, 600),
+    "market_data": (100, 0),
+    "contract_details": (50, 1),
+}
+HISTORICAL_PER_CONTRACT_LIMIT = (5, 2)  # IB flags six or more requests for one contract within 2 seconds
+
+# Shared-memory market data bus for local reader processes
+MARKET_BUS_ENABLED = os.getenv("MARKET_BUS_ENABLED", "0") == "1"
+MARKET_BUS_NAME = os.getenv("MARKET_BUS_NAME", "ibbot")
+MARKET_BUS_CAPACITY = 1024  # bars kept per symbol/timeframe ring
+
+# Record every inbound IB callback to this event log (replay with `python recorder.py <path>`)
+RECORD_EVENTS_PATH = os.getenv("IB_RECORD_EVENTS")
+
+# On-demand profiling (SIGUSR1 toggles counters, SIGUSR2 samples stacks, or write a command to the control file)
+PROFILE_ON_START = os.getenv("IB_PROFILE", "0") == "1"
+PROFILE_CONTROL_FILE = "profile.ctl"  # "on", "off", "dump", "reset" or "sample [seconds]"
+PROFILE_OUTPUT_DIR = "profiles"
+PROFILE_SAMPLE_SECONDS = 30
+PROFILE_SAMPLE_INTERVAL = 0.005  # seconds between stack samples
+
+# Prometheus metrics endpoint (http://METRICS_HOST:METRICS_PORT/metrics); port 0 disables it
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+METRICS_RATE_WINDOW = 60  # seconds averaged for per-second rates
+
+# Run bot.py as a single asyncio event loop (bot.main_async) instead of threads and sleeps
+ASYNC_MAIN = os.getenv("IB_ASYNC", "0") == "1"
+
 # Trading parameters
 SYMBOLS = ["EURUSD", "GBPUSD", "USDJPY", "AUDUSD", "USDCAD"]
 # Updated trading parameters
@@ -26,6 +66,19 @@ RISK_PER_TRADE = 0.02  # 2% per Trade
 FAST_EMA = 5
 SLOW_EMA = 20
 
+# Strategy runner: slots are evaluated concurrently on a worker pool each cycle
+STRATEGY_WORKERS = 4
+STRATEGY_TIMEOUT = 30  # seconds a strategy may take before its signals are skipped
+
+# Portfolio risk limits
+ACCOUNT_CURRENCY = "USD"
+MAX_CURRENCY_EXPOSURE = 5.0  # max net exposure per currency, multiple of net liquidation
+MAX_MARGIN_UTILIZATION = 0.5  # max share of net liquidation used as margin at LEVERAGE
+MAX_VAR_FRACTION = 0.03  # max 1-day VaR as share of net liquidation
+VAR_Z = 2.33  # 99% one-sided
+VAR_HORIZON_BARS = 24  # H1 bars per VaR horizon
+RISK_COV_REFRESH_SECONDS = 300
+
 # RSI parameters
 RSI_PERIOD = 14
 RSI_OVERBOUGHT = 70
@@ -46,6 +99,34 @@ TIMEFRAMES = {
     "D1": "1 day"
 }
 
+# DataHandler storage: bars kept in memory per timeframe, indicator dtype and frame index
+FRAME_RETENTION = {"M1": 300, "M15": 300, "H1": 300, "H4": 300, "D1": 300}
+COMPACT_FRAMES = os.getenv("COMPACT_FRAMES", "0") == "1"  # float32 indicators and int64 epoch-second index
+INDICATOR_DTYPE = "float32" if COMPACT_FRAMES else "float64"
+EPOCH_INDEX = COMPACT_FRAMES
+MEMORY_BUDGET_MB = float(os.getenv("MEMORY_BUDGET_MB", "0"))  # all frames together; 0 means no budget
+# Budget eviction keeps this many spans of the longest EMA so its seed history carries
+# a weight of at most exp(-2 * EMA_SETTLE_SPANS) (about 5e-5) of the untrimmed value
+EMA_SETTLE_SPANS = 5
+BAR_ARCHIVE_DIR = "historical_data"  # completed bars are appended here, evicted history stays readable
+
+# Deep history downloads into the bar archive (python history_downloader.py --start ...)
+DOWNLOAD_CHECKPOINT_PATH = "history_download.json"
+DOWNLOAD_MAX_IN_FLIGHT = 20  # chunk requests handed to the scheduler at once
+DOWNLOAD_REQ_ID_BASE = 200000
+DOWNLOAD_REQ_ID_RANGE = 100000
+
+# Request ids used by the asyncio facade (async_client.py)
+ASYNC_REQ_ID_BASE = 500000
+ASYNC_REQ_ID_RANGE = 100000
+
+# Training datasets built from the bar archive (python dataset_builder.py)
+DATASET_DIR = "datasets"
+DATASET_WINDOW = 60   # M1 rows per sample
+DATASET_HORIZON = 15  # label: log return this many M1 bars after the window's last row
+DATASET_STRIDE = 1    # M1 rows between consecutive windows
+DATASET_WORKERS = None  # processes; None uses every core
+
 # Trailing stop parameters
 TRAILING_STOP_START = 0.5  # Start trailing at 50% of take profit
 TRAILING_STOP_STEP = 10  # 10 pips for EUR/USD
@@ -7,79 +7,213 @@ from ibapi.client import EClient
 # Removed unused import AccountSummaryTags
 import threading
 
-from config import logger
+from config import logger, MARKET_BUS_ENABLED, RECORD_EVENTS_PATH, PROFILE_ON_START
+from account_state import AccountState
+from contracts import ContractRegistry
 from data_handler import DataHandler
+from historical_data_manager import HistoricalDataManager
+from realtime_data_manager import RealTimeDataManager
+from risk_engine import RiskEngine
+from history_downloader import HistoryDownloader
+from async_client import AsyncClient
+from scheduler import RequestScheduler
 from strategy import TradingStrategy
+from strategy_runner import StrategyRunner
 from order_manager import OrderManager
+from metrics import Metrics
+from profiling import Profiler
 
 class IBConnection(EWrapper, EClient):
-    def __init__(self):
+    def __init__(self, trading=True, threaded_strategy=True):
         EClient.__init__(self, self)
+        self.trading = trading  # False for data-only sessions (e.g. the history downloader)
+        self.threaded_strategy = threaded_strategy  # False when an asyncio task runs the strategy instead
+        # Optionally tee every inbound callback into an event log for replay (the trading bot's log only)
+        self.recorder = None
+        if RECORD_EVENTS_PATH and trading:
+            from recorder import EventRecorder
+            self.recorder = EventRecorder(RECORD_EVENTS_PATH)
+            self.wrapper = self.recorder.wrap(self)
+        # Callback counts and reader-thread busy time for the metrics endpoint
+        self.metrics = Metrics(self)
+        self.wrapper = self.metrics.wrap(self.wrapper)
         self.done = Event()  # use threading.Event to signal between threads
         self.connection_ready = Event()  # to signal the connection has been established
-        self.accountValue = (None, None, None)  # Initialize accountValue
         self.nextOrderId = None
+        self.session = None  # SessionManager, attached when it takes over the connection
+        self.strategy_thread = None
         
         # Initialize modules
+        self.scheduler = RequestScheduler(can_send=self.isConnected)
+        self.account_state = AccountState(self)
+        self.contracts = ContractRegistry(self)
         self.data_handler = DataHandler()
-        self.strategy = TradingStrategy(self.data_handler)
+        # Only the trading bot publishes; a second publisher would clash with its shared memory
+        if MARKET_BUS_ENABLED and trading:
+            from market_bus import MarketDataPublisher
+            self.data_handler.publisher = MarketDataPublisher()
+        self.historical_data = HistoricalDataManager(self, self.data_handler)
+        self.realtime_data = RealTimeDataManager(self, self.data_handler)
+        self.downloader = HistoryDownloader(self, self.data_handler.archive)
+        self.async_client = AsyncClient(self)  # awaitable requests for asyncio callers
         self.order_manager = OrderManager(self)
+        # Strategy slots share this connection and DataHandler; add more with self.strategies.add()
+        self.strategy = TradingStrategy(self.data_handler)
+        self.strategies = StrategyRunner(self)
+        self.strategies.add("main", self.strategy)
+        self.risk_engine = RiskEngine(self)
+        
+        # Profiling hooks for the callback, bar processing, signal and order paths (off until switched on)
+        self.profiler = Profiler(stop=self.done)
+        self.profiler.register(self, [name for name in type(self).__dict__ if not name.startswith("_") and hasattr(EWrapper, name)])
+        self.profiler.register(self.data_handler, ["process_historical_data", "_calculate_indicators"])
+        self.profiler.register(self.strategy, ["calculate_signals"])
+        self.profiler.register(self.strategies, ["run_cycle"])
+        self.profiler.register(self.risk_engine, ["refresh", "filter_signals"])
+        self.profiler.register(self.order_manager, ["place_order", "update_order_status", "calculate_position_size", "check_trailing_stops"])
+        if trading:
+            self.profiler.watch_control_file()  # one bot owns the control file
+        if PROFILE_ON_START:
+            self.profiler.enable()
     
     def error(self, reqId, errorCode, errorString, advancedOrderRejectJson=None, errorTime=None):
         logger.info(f"Error: {reqId}, Code: {errorCode}, Message: {errorString}")
         
-        # Critical errors that should stop the bot
-        critical_errors = [502, 504, 1100, 1300]
-        if errorCode in critical_errors:
-            logger.error("Critical error detected. Stopping bot...")
-            self.done.set()
+        # Release or re-queue the scheduled request this error belongs to
+        if reqId >= 0:
+            self.historical_data.on_error(reqId, errorCode, errorString)
+            self.downloader.on_error(reqId, errorCode, errorString)
+            self.contracts.on_error(reqId, errorCode, errorString)
+            self.async_client.on_error(reqId, errorCode, errorString)
+        
+        # Connectivity errors are handled by the session manager (reconnect and restore)
+        if self.session is not None:
+            self.session.on_error(errorCode)
         
         # Connection-related warnings
         connection_warnings = [2104, 2107, 2108, 2158]
         if errorCode in connection_warnings:
             logger.info(f"Connection notice: {errorString}")
     
+    def disconnect(self):
+        """Close the socket, unless called by a message loop left over from an earlier socket"""
+        if self.session is not None and self.session.is_stale_reader(threading.current_thread()):
+            return
+        super().disconnect()
+    
+    def placeOrder(self, orderId, contract, order):
+        """Send an order, noting the submit time for round-trip metrics"""
+        self.metrics.on_order_sent(orderId)
+        super().placeOrder(orderId, contract, order)
+    
     def historicalData(self, reqId, bar):
         """Handle incoming historical data"""
+        if self.downloader.owns(reqId):
+            self.downloader.on_bar(reqId, bar)
+            return
+        if self.async_client.owns(reqId):
+            self.async_client.on_bar(reqId, bar)
+            return
+        self.data_handler.process_historical_data(reqId, bar)
+    
+    def historicalDataUpdate(self, reqId, bar):
+        """Handle streamed bar updates for keepUpToDate requests"""
         self.data_handler.process_historical_data(reqId, bar)
     
     def historicalDataEnd(self, reqId, start, end):
         """Handle end of historical data stream"""
-        from config import SYMBOLS
+        from config import SYMBOLS, TIMEFRAMES
+        if self.downloader.owns(reqId):
+            self.downloader.on_end(reqId)
+            return
+        if self.async_client.owns(reqId):
+            self.async_client.on_end(reqId)
+            return
+        self.historical_data.on_historical_data_end(reqId)
+        self.async_client.on_stream_loaded(reqId)
         try:
-            sym = SYMBOLS[reqId]
-            logger.info(f"Historical data received for {sym}")
+            sym = SYMBOLS[reqId // 100]
+            tf = list(TIMEFRAMES)[reqId % 100]
+            logger.info(f"Historical data received for {sym} ({tf})")
         except Exception as e:
             logger.error(f"Error in historicalDataEnd: {str(e)}")
     
-    def accountSummaryValue(self, key, val, cur, accountName):
-        """Store account summary value"""
-        self.accountValue = (key, val, cur)
+    def contractDetails(self, reqId, contractDetails):
+        """Handle resolved contract details"""
+        if self.async_client.owns(reqId):
+            self.async_client.on_contract_details(reqId, contractDetails)
+            return
+        self.contracts.on_contract_details(reqId, contractDetails)
+    
+    def contractDetailsEnd(self, reqId):
+        """Handle end of contract details"""
+        if self.async_client.owns(reqId):
+            self.async_client.on_end(reqId)
+            return
+        self.contracts.on_contract_details_end(reqId)
+    
+    def managedAccounts(self, accountsList: str):
+        """Handle the list of accounts managed by this login"""
+        self.account_state.on_managed_accounts(accountsList)
     
     def accountSummary(self, reqId, account, tag, value, currency):
         """Handle account summary information"""
-        logger.info(f"AccountSummary. ReqId: {reqId}, Account: {account}, Tag: {tag}, Value: {value}, Currency: {currency}")
+        if self.async_client.owns(reqId):
+            self.async_client.on_account_summary(reqId, tag, value)
+            return
+        self.account_state.on_account_summary(tag, value, currency)
     
     def accountSummaryEnd(self, reqId: int):
-        """Handle end of account summary information"""
-        logger.info(f"AccountSummaryEnd. ReqId: {reqId}")
-        self.done.set()
+        """Handle end of the initial account summary snapshot (updates keep streaming)"""
+        if self.async_client.owns(reqId):
+            self.async_client.on_end(reqId)
+            return
+        logger.info(f"Account summary received: {self.account_state.values}")
+    
+    def position(self, account, contract, position, avgCost):
+        """Handle position updates"""
+        self.account_state.on_position(contract, position, avgCost)
+    
+    def positionEnd(self):
+        """Handle end of the initial positions snapshot"""
+        logger.info(f"Positions received: {self.account_state.positions}")
+    
+    def pnl(self, reqId, dailyPnL, unrealizedPnL, realizedPnL):
+        """Handle account PnL updates"""
+        self.account_state.on_pnl(dailyPnL, unrealizedPnL, realizedPnL)
     
     def nextValidId(self, orderId: int):
         """Handle next valid order ID"""
         logger.info(f"Connection ready, next valid order ID: {orderId}")
-        self.nextOrderId = orderId
+        self.order_manager.on_next_valid_id(orderId)
         self.connection_ready.set()  # signal that the connection is ready
-        threading.Thread(target=self.run_strategy, daemon=True).start()
+        if self.session is not None:
+            self.session.on_ready()
+        # nextValidId arrives again after every reconnect; run only one strategy loop
+        if self.trading and self.threaded_strategy and self.strategy_thread is None:
+            self.strategy_thread = threading.Thread(target=self.run_strategy, daemon=True)
+            self.strategy_thread.start()
+    
+    def connectionClosed(self):
+        """Handle the API socket closing"""
+        logger.warning("Connection to IB closed")
+        if self.session is not None:
+            self.session.on_connection_closed()
+    
+    def openOrder(self, orderId, contract, order, orderState):
+        """Handle open orders reported by IB (reconciliation after reconnect)"""
+        self.order_manager.reconcile_open_order(orderId, contract, order)
     
     def orderStatus(self, orderId, status, filled, remaining, avgFillPrice, permId, parentId, lastFillPrice, clientId, whyHeld, mktCapPrice):
         """Handle order status updates"""
         logger.info(f"Order {orderId} status: {status}, filled: {filled}, remaining: {remaining}, avgFillPrice: {avgFillPrice}")
-        self.order_manager.update_order_status(orderId, status, parentId)
+        self.order_manager.update_order_status(orderId, status, filled, remaining, avgFillPrice, parentId)
+        self.async_client.on_order_status(orderId, status, filled, remaining, avgFillPrice)
     
     def execDetails(self, reqId, contract, execution):
         """Handle execution details"""
         logger.info(f"Execution: {execution.orderId}, {execution.side}, {execution.shares} @ {execution.price}")
+        self.order_manager.reconcile_execution(contract, execution)
     
     def run_strategy(self):
         """Run the trading strategy"""
@@ -91,16 +225,10 @@ class IBConnection(EWrapper, EClient):
                 # 1. Request historical data
                 self._request_historical_data()
                 
-                # 2. Calculate signals & place orders
-                signals = self.strategy.calculate_signals(self.order_manager.open_orders)
-                
-                # 3. Execute signals
-                for signal in signals:
-                    self.order_manager.place_order(
-                        signal["symbol"], 
-                        signal["direction"], 
-                        signal["price"]
-                    )
+                # 2. Evaluate all strategies, net their signals, risk-check and place orders
+                cycle_start = time.perf_counter()
+                self.strategies.run_cycle()
+                self.metrics.observe_cycle(time.perf_counter() - cycle_start)
                 
                 logger.info("Completed strategy iteration, waiting for next cycle")
                 time.sleep(60)  # 1-minute cycle
@@ -110,23 +238,19 @@ class IBConnection(EWrapper, EClient):
                 time.sleep(30)  # Wait before retrying
     
     def _request_historical_data(self):
-        """Request historical data for all symbols"""
-        from config import SYMBOLS
-        from ibapi.contract import Contract
-
+        """Open streaming bar subscriptions for every symbol and timeframe not yet subscribed"""
+        from config import SYMBOLS, TIMEFRAMES
         
-        for i, sym in enumerate(SYMBOLS):
-            contract = Contract()
-            contract.symbol = sym[:3]
-            contract.secType = "CASH"
-            contract.currency = sym[3:]
-            contract.exchange = "IDEALPRO"
-            self.reqHistoricalData(
-                i, contract, "", "100 D", "1 min", "MIDPOINT", 1, 1, False, []
-            )
+        requested = False
+        for sym in SYMBOLS:
+            for tf in TIMEFRAMES:
+                if not self.historical_data.is_subscribed(sym, tf):
+                    self.historical_data.subscribe_bars(sym, tf)
+                    requested = True
         
-        logger.info("Requested historical data for all symbols")
-        time.sleep(5)  # Wait for data to arrive
+        if requested:
+            logger.info("Requested historical data for all symbols")
+            time.sleep(5)  # Wait for data to arrive
     
     def request_market_data(self):
         from ibapi.contract import Contract
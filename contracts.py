@@ -0,0 +1,163 @@
+from collections import namedtuple
+import json
+import math
+import os
+import time
+from ibapi.contract import Contract
+from config import logger, CONTRACT_CACHE_PATH, CONTRACT_CACHE_MAX_AGE_DAYS
+
+# Request IDs reserved for contract details lookups (base + symbol index)
+CONTRACT_DETAILS_REQ_ID_BASE = 7000
+
+# Resolved instrument attributes, as returned by reqContractDetails
+ContractSpec = namedtuple("ContractSpec", [
+    "symbol", "con_id", "min_tick", "size_increment", "min_size",
+    "trading_hours", "liquid_hours", "time_zone", "resolved_at",
+])
+
+
+class FrozenContract(Contract):
+    """ibapi Contract that cannot be modified once built, so one instance can be shared"""
+
+    def __init__(self, **fields):
+        Contract.__init__(self)
+        for name, value in fields.items():
+            setattr(self, name, value)
+        object.__setattr__(self, "_frozen", True)
+
+    def __setattr__(self, name, value):
+        if getattr(self, "_frozen", False):
+            raise AttributeError("Contracts handed out by ContractRegistry are immutable")
+        object.__setattr__(self, name, value)
+
+
+def _forex_fields(symbol):
+    return {"symbol": symbol[:3], "secType": "CASH", "currency": symbol[3:], "exchange": "IDEALPRO"}
+
+
+def _to_float(value, default):
+    """Convert ibapi numeric fields (float, Decimal or str) falling back on unset values"""
+    try:
+        value = float(str(value))
+    except (TypeError, ValueError):
+        return default
+    if math.isnan(value) or value <= 0 or value >= 1e300:
+        return default
+    return value
+
+
+class ContractRegistry:
+    """Resolves each instrument once via reqContractDetails and caches it in memory and on disk"""
+
+    def __init__(self, client, cache_path=CONTRACT_CACHE_PATH):
+        self.client = client
+        self.cache_path = cache_path
+        self.specs = {}       # symbol -> ContractSpec
+        self.contracts = {}   # symbol -> FrozenContract
+        self.pending = {}     # reqId -> symbol
+        self._load()
+
+    def get(self, symbol):
+        """Get the shared immutable contract for a symbol (never blocks)"""
+        contract = self.contracts.get(symbol)
+        if contract is None:
+            logger.warning(f"Contract for {symbol} not resolved yet, using unvalidated definition")
+            contract = FrozenContract(**_forex_fields(symbol))
+            self.contracts[symbol] = contract
+        return contract
+
+    def spec(self, symbol):
+        """Get the resolved contract attributes for a symbol, or None"""
+        return self.specs.get(symbol)
+
+    def round_price(self, symbol, price):
+        """Round a price to the instrument's minimum tick"""
+        spec = self.specs.get(symbol)
+        if spec is None:
+            return round(price, 3 if "JPY" in symbol else 5)
+        ticks = round(price / spec.min_tick)
+        decimals = max(0, -int(math.floor(math.log10(spec.min_tick)))) + 1
+        return round(ticks * spec.min_tick, decimals)
+
+    def round_quantity(self, symbol, quantity):
+        """Round a quantity down to the instrument's size increment, respecting the minimum size"""
+        spec = self.specs.get(symbol)
+        if spec is None:
+            return quantity
+        qty = math.floor(quantity / spec.size_increment) * spec.size_increment
+        qty = max(qty, spec.min_size)
+        return int(qty) if float(qty).is_integer() else qty
+
+    def resolve_all(self, symbols):
+        """Request contract details for every symbol that is missing or stale"""
+        max_age = CONTRACT_CACHE_MAX_AGE_DAYS * 24 * 60 * 60
+        for i, sym in enumerate(symbols):
+            spec = self.specs.get(sym)
+            if spec is not None and time.time() - spec.resolved_at < max_age:
+                continue
+            req_id = CONTRACT_DETAILS_REQ_ID_BASE + i
+            self.pending[req_id] = sym
+            contract = FrozenContract(**_forex_fields(sym))
+            if self.client.scheduler.submit(
+                "contract_details", ("contract_details", req_id),
+                lambda req_id=req_id, contract=contract: self.client.reqContractDetails(req_id, contract),
+            ):
+                logger.info(f"Resolving contract for {sym}")
+
+    def on_contract_details(self, reqId, details):
+        """Store the resolved contract for a pending lookup"""
+        sym = self.pending.get(reqId)
+        if sym is None:
+            return
+        c = details.contract
+        spec = ContractSpec(
+            symbol=sym,
+            con_id=c.conId,
+            min_tick=_to_float(getattr(details, "minTick", None), 0.00001),
+            size_increment=_to_float(getattr(details, "sizeIncrement", None), 1.0),
+            min_size=_to_float(getattr(details, "minSize", None), 1.0),
+            trading_hours=getattr(details, "tradingHours", ""),
+            liquid_hours=getattr(details, "liquidHours", ""),
+            time_zone=getattr(details, "timeZoneId", ""),
+            resolved_at=time.time(),
+        )
+        self._install(spec)
+        logger.info(f"Resolved {sym}: conId={spec.con_id}, minTick={spec.min_tick}, sizeIncrement={spec.size_increment}")
+
+    def on_contract_details_end(self, reqId):
+        self.client.scheduler.complete(("contract_details", reqId))
+        if self.pending.pop(reqId, None) is not None:
+            self._save()
+
+    def on_error(self, reqId, errorCode, errorString):
+        """A lookup failed; keep the unvalidated contract and allow a later retry"""
+        if self.pending.pop(reqId, None) is not None:
+            self.client.scheduler.complete(("contract_details", reqId))
+            logger.error(f"Contract lookup {reqId} failed: {errorString}")
+
+    def _install(self, spec):
+        fields = _forex_fields(spec.symbol)
+        fields["conId"] = spec.con_id
+        # Swap in both entries as whole objects; readers never see a partial update
+        self.specs[spec.symbol] = spec
+        self.contracts[spec.symbol] = FrozenContract(**fields)
+
+    def _load(self):
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path) as f:
+                for row in json.load(f).values():
+                    self._install(ContractSpec(**row))
+            logger.info(f"Loaded {len(self.specs)} contracts from {self.cache_path}")
+        except Exception as e:
+            logger.error(f"Error loading contract cache: {str(e)}")
+
+    def _save(self):
+        try:
+            tmp_path = self.cache_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({sym: spec._asdict() for sym, spec in self.specs.items()}, f, indent=2)
+            os.replace(tmp_path, self.cache_path)
+        except Exception as e:
+            logger.error(f"Error saving contract cache: {str(e)}")
@@ -1,16 +1,278 @@
+from threading import Lock
+import time
+import numpy as np
 import pandas as pd
-# import numpy as np
-from config import logger, SYMBOLS, TIMEFRAMES, RSI_PERIOD, BB_PERIOD, BB_STD_DEV
-import os
+from config import (
+    logger, SYMBOLS, TIMEFRAMES, FRAME_RETENTION, INDICATOR_DTYPE, EPOCH_INDEX, MEMORY_BUDGET_MB
+)
+from indicator_graph import IndicatorPlan, ALL_INDICATORS
+from bar_archive import BarArchive, bar_time_to_epoch
+
+BAR_COLUMNS = ["open", "high", "low", "close", "volume"]
+CLOSE = BAR_COLUMNS.index("close")
+
+
+class IndicatorSnapshot:
+    """Immutable latest/previous indicator values for one symbol and timeframe"""
+    __slots__ = (
+        "time", "bars",
+        "close", "prev_close",
+        "ema_fast", "prev_ema_fast",
+        "ema_slow", "prev_ema_slow",
+        "histogram", "prev_histogram",
+        "rsi", "prev_rsi",
+        "bb_upper", "prev_bb_upper",
+        "bb_middle", "prev_bb_middle",
+        "bb_lower", "prev_bb_lower",
+    )
+
+    # Columns copied out of the store, in the order they are read
+    COLUMNS = ("close", "ema_fast", "ema_slow", "histogram", "rsi", "bb_upper", "bb_middle", "bb_lower")
+
+    def __init__(self, time, bars, last, prev):
+        object.__setattr__(self, "time", time)
+        object.__setattr__(self, "bars", bars)
+        for col, cur_val, prev_val in zip(self.COLUMNS, last, prev):
+            object.__setattr__(self, col, cur_val)
+            object.__setattr__(self, "prev_" + col, prev_val)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("IndicatorSnapshot is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("IndicatorSnapshot is immutable")
+
+    def __repr__(self):
+        return f"IndicatorSnapshot(time={self.time}, bars={self.bars}, close={self.close}, rsi={self.rsi})"
+
+    @classmethod
+    def from_store(cls, store, epoch_index=EPOCH_INDEX):
+        """Build a snapshot from the last two bars of a BarStore"""
+        # Indicators no strategy asked for are not materialized; they read as NaN
+        with store.lock:
+            last = [store._value(col, -1) for col in cls.COLUMNS]
+            prev = [store._value(col, -2) for col in cls.COLUMNS]
+            time, bars = store._last_time(), len(store)
+        return cls(store.index_value(time, epoch_index), bars, last, prev)
+
+
+class BarStore:
+    """
+    Columnar bars and indicators for one symbol and timeframe.
+
+    Rows live in preallocated NumPy arrays between start and end. New bars are written
+    in place and old ones dropped by moving start, so a bar never rebuilds a frame; the
+    live window is only copied to the front when the arrays fill up.
+
+    Writers and readers on other threads (strategy, risk engine) hold `lock`, so a reader
+    never sees arrays swapped by a reallocation halfway through building a frame.
+    """
+
+    def __init__(self, retention, indicator_dtype=INDICATOR_DTYPE):
+        self.retention = retention
+        self.indicator_dtype = np.dtype(indicator_dtype)
+        self.indicators = {}  # name -> array aligned with times
+        self.start = 0
+        self.end = 0
+        self.updated = 0.0  # wall time of the last bar, for picking cold stores to evict
+        self.lock = Lock()
+        self._allocate(min(64, self._capacity_for(retention)))
+
+    def __len__(self):
+        return self.end - self.start
+
+    @staticmethod
+    def _capacity_for(retention):
+        # Slack past the retention window so compaction happens once per slack bars
+        return retention + max(16, retention // 4)
+
+    def _allocate(self, capacity):
+        """(Re)allocate arrays with room for capacity rows, keeping the newest live rows"""
+        keep = min(len(self), self.retention, capacity)
+        live = slice(self.end - keep, self.end)
+        times = np.empty(capacity, dtype=np.int64)
+        bars = np.full((len(BAR_COLUMNS), capacity), np.nan)
+        indicators = {name: np.full(capacity, np.nan, dtype=self.indicator_dtype) for name in self.indicators}
+        if keep:
+            times[:keep] = self.times[live]
+            bars[:, :keep] = self.bars[:, live]
+            for name, values in self.indicators.items():
+                indicators[name][:keep] = values[live]
+        self.times, self.bars, self.indicators = times, bars, indicators
+        self.start, self.end = 0, keep
+
+    @property
+    def capacity(self):
+        return len(self.times)
+
+    @property
+    def nbytes(self):
+        return self.times.nbytes + self.bars.nbytes + sum(values.nbytes for values in list(self.indicators.values()))
+
+    @property
+    def last_time(self):
+        with self.lock:
+            return self._last_time()
+
+    def _last_time(self):
+        return int(self.times[self.end - 1]) if len(self) else None
+
+    @property
+    def close(self):
+        """Close prices of the live window (view, for the writer thread only)"""
+        return self.bars[CLOSE, self.start:self.end]
+
+    def add(self, epoch, ohlcv):
+        """
+        Insert or overwrite a bar.
+        Returns:
+            list of (epoch, open, high, low, close, volume) bars that are now final
+        """
+        with self.lock:
+            if len(self) and epoch <= self.times[self.end - 1]:
+                pos = self.start + int(np.searchsorted(self.times[self.start:self.end], epoch))
+                if self.times[pos] == epoch:
+                    # Same bar again: an update of the forming bar, or an overlap after a reconnect
+                    self.bars[:, pos] = ohlcv
+                    return [] if pos == self.end - 1 else [(epoch, *ohlcv)]
+                final = [(epoch, *ohlcv)]
+            else:
+                pos = None
+                final = [self._row(-1)] if len(self) else []
+
+            if self.end == self.capacity:
+                # Grow while below retention, otherwise compact the live window to the front
+                target = self._capacity_for(self.retention)
+                self._allocate(max(self.capacity, min(self.capacity * 2, target)))
+                if pos is not None:
+                    pos = self.start + int(np.searchsorted(self.times[self.start:self.end], epoch))
+            if pos is None:
+                pos = self.end
+            else:
+                # Missing bar inside the window: shift the newer rows up by one
+                self.times[pos + 1:self.end + 1] = self.times[pos:self.end]
+                self.bars[:, pos + 1:self.end + 1] = self.bars[:, pos:self.end]
+                for values in self.indicators.values():
+                    values[pos + 1:self.end + 1] = values[pos:self.end]
+            self.times[pos] = epoch
+            self.bars[:, pos] = ohlcv
+            for values in self.indicators.values():
+                values[pos] = np.nan
+            self.end += 1
+            self.start = max(self.start, self.end - self.retention)
+            return final
+
+    def set_indicators(self, values):
+        """Store indicator arrays computed over the live window"""
+        with self.lock:
+            for name, column in values.items():
+                target = self.indicators.get(name)
+                if target is None:
+                    target = self.indicators[name] = np.full(self.capacity, np.nan, dtype=self.indicator_dtype)
+                target[self.start:self.end] = column
+
+    def keep_indicators(self, names):
+        """Drop indicator columns no longer computed"""
+        with self.lock:
+            for name in list(self.indicators):
+                if name not in names:
+                    del self.indicators[name]
+
+    def shrink(self, retention):
+        """Lower the retention and release memory held for older bars; returns bytes freed"""
+        with self.lock:
+            before = self.nbytes
+            self.retention = retention
+            self._allocate(self._capacity_for(retention))
+            return before - self.nbytes
+
+    def value(self, column, offset):
+        """Value of a bar or indicator column offset rows from the end (-1 is the newest), NaN if absent"""
+        with self.lock:
+            return self._value(column, offset)
+
+    def _value(self, column, offset):
+        if len(self) < -offset:
+            return float("nan")
+        if column in self.indicators:
+            return float(self.indicators[column][self.end + offset])
+        if column in BAR_COLUMNS:
+            return float(self.bars[BAR_COLUMNS.index(column), self.end + offset])
+        return float("nan")
+
+    def row(self, offset):
+        """(epoch, open, high, low, close, volume) of a bar offset rows from the end"""
+        with self.lock:
+            return self._row(offset)
+
+    def _row(self, offset):
+        i = self.end + offset
+        return (int(self.times[i]), *self.bars[:, i].tolist())
+
+    def last_values(self):
+        """Newest bar and indicator values by column name"""
+        with self.lock:
+            values = dict(zip(BAR_COLUMNS, self.bars[:, self.end - 1].tolist()))
+            values.update({name: float(column[self.end - 1]) for name, column in self.indicators.items()})
+        return values
+
+    @staticmethod
+    def index_value(epoch, epoch_index=EPOCH_INDEX):
+        return epoch if epoch_index else pd.Timestamp(epoch, unit="s")
+
+    def frame(self, epoch_index=EPOCH_INDEX):
+        """Copy of the live window as a DataFrame (bars, then indicators)"""
+        # Copy arrays and bounds together; the reader thread may reallocate them at any bar
+        with self.lock:
+            live = slice(self.start, self.end)
+            data = {col: self.bars[i, live].copy() for i, col in enumerate(BAR_COLUMNS)}
+            data.update({name: values[live].copy() for name, values in self.indicators.items()})
+            times = self.times[live].copy()
+        index = times if epoch_index else pd.to_datetime(times, unit="s")
+        return pd.DataFrame(data, index=index, copy=False)
+
 
 class DataHandler:
     def __init__(self):
-        # Initialize data structure for each symbol and timeframe
+        # Initialize bar storage for each symbol and timeframe
         self.data = {
-            sym: {tf: pd.DataFrame() for tf in TIMEFRAMES} 
+            sym: {tf: BarStore(FRAME_RETENTION.get(tf, 300)) for tf in TIMEFRAMES}
             for sym in SYMBOLS
         }
-    
+        # Completed bars go to disk as they close; memory holds only the retention window
+        self.archive = BarArchive()
+        self.memory_budget = int(MEMORY_BUDGET_MB * 1024 * 1024)
+        # Latest indicator snapshot per symbol and timeframe. Entries are replaced
+        # wholesale (a single reference swap), so readers on other threads never
+        # need a lock and never touch the bar arrays.
+        self.snapshots = {
+            sym: {tf: None for tf in TIMEFRAMES}
+            for sym in SYMBOLS
+        }
+        # Optional MarketDataPublisher sharing bars with other local processes
+        self.publisher = None
+        # Indicators (and lookbacks) requested per timeframe by registered strategies.
+        # Until a strategy registers, every indicator is computed.
+        self.requirements = {}
+        self.plans = {tf: IndicatorPlan(ALL_INDICATORS) for tf in TIMEFRAMES}
+
+    def register_strategy(self, strategy):
+        """Add a strategy's declared indicators and lookbacks to the computation plans"""
+        for tf, req in strategy.requirements().items():
+            indicators, lookback = self.requirements.get(tf, (set(), 0))
+            self.requirements[tf] = (indicators | set(req.get("indicators", [])), max(lookback, req.get("lookback", 0)))
+        self.plans = {
+            tf: IndicatorPlan(*self.requirements.get(tf, (set(), 0)))
+            for tf in TIMEFRAMES
+        }
+        for tf, plan in self.plans.items():
+            logger.info(f"Indicator plan for {tf}: {plan}")
+            # Retention never drops below what the plan needs to produce values
+            for frames in self.data.values():
+                store = frames[tf]
+                store.retention = max(store.retention, plan.min_bars)
+                store.keep_indicators(plan.outputs)
+
     def process_historical_data(self, reqId, bar, timeframe_key=None):
         """Process incoming historical data bars"""
         try:
@@ -18,91 +280,138 @@ class DataHandler:
             # Format: reqId = symbol_index * 100 + timeframe_index
             symbol_index = reqId // 100
             timeframe_index = reqId % 100
-            
+
             if symbol_index >= len(SYMBOLS):
                 logger.error(f"Invalid symbol index: {symbol_index}")
                 return
-                
+
             sym = SYMBOLS[symbol_index]
-            
+
             # Map timeframe index to key
             tf_keys = list(TIMEFRAMES.keys())
             if timeframe_index >= len(tf_keys):
                 logger.error(f"Invalid timeframe index: {timeframe_index}")
                 return
-                
+
             tf = tf_keys[timeframe_index]
-            
-            # Get dataframe for this symbol and timeframe
-            df = self.data[sym][tf]
-            
-            # Add new data
-            df.loc[pd.to_datetime(bar.date)] = {
-                "open": bar.open,
-                "high": bar.high,
-                "low": bar.low,
-                "close": bar.close,
-                "volume": bar.volume if hasattr(bar, 'volume') else 0
-            }
-            
-            # Keep only the last 300 bars to manage memory
-            self.data[sym][tf] = df.tail(300)
-            
+
+            # Write the bar in place; the store trims itself to the retention window
+            store = self.data[sym][tf]
+            allocated = store.nbytes
+            final = store.add(
+                bar_time_to_epoch(bar.date),
+                (bar.open, bar.high, bar.low, bar.close, bar.volume if hasattr(bar, 'volume') else 0)
+            )
+            store.updated = time.time()
+
+            # Bars that can no longer change are archived, so evicting them later loses nothing
+            if final:
+                self.archive.append(sym, tf, final)
+            if store.nbytes > allocated:
+                self._enforce_memory_budget()
+
             # Calculate indicators when we have enough data
             self._calculate_indicators(sym, tf)
-            
+
         except Exception as e:
             logger.error(f"Error processing historical data: {str(e)}")
-    
+
     def _calculate_indicators(self, symbol, timeframe):
         """Calculate technical indicators for a specific symbol and timeframe"""
         try:
-            df = self.data[symbol][timeframe]
-            if len(df) < max(RSI_PERIOD, BB_PERIOD, 26):  # Need enough data for all indicators
-                return
-                
-            # Calculate EMAs
-            df['ema_fast'] = df['close'].ewm(span=5).mean()
-            df['ema_slow'] = df['close'].ewm(span=20).mean()
-            
-            # Calculate MACD
-            df['ema12'] = df['close'].ewm(span=12).mean()
-            df['ema26'] = df['close'].ewm(span=26).mean()
-            df['macd'] = df['ema12'] - df['ema26']
-            df['signal'] = df['macd'].ewm(span=9).mean()
-            df['histogram'] = df['macd'] - df['signal']
-            
-            # Calculate RSI
-            delta = df['close'].diff()
-            gain = delta.where(delta > 0, 0)
-            loss = -delta.where(delta < 0, 0)
-            avg_gain = gain.rolling(window=RSI_PERIOD).mean()
-            avg_loss = loss.rolling(window=RSI_PERIOD).mean()
-            rs = avg_gain / avg_loss
-            df['rsi'] = 100 - (100 / (1 + rs))
-            
-            # Calculate Bollinger Bands
-            df['bb_middle'] = df['close'].rolling(window=BB_PERIOD).mean()
-            df['bb_std'] = df['close'].rolling(window=BB_PERIOD).std()
-            df['bb_upper'] = df['bb_middle'] + (df['bb_std'] * BB_STD_DEV)
-            df['bb_lower'] = df['bb_middle'] - (df['bb_std'] * BB_STD_DEV)
-            
-            # Update the dataframe
-            self.data[symbol][timeframe] = df
-            
-            # Store extended history for AI training
-            history_path = f"historical_data/{symbol}_{timeframe}.csv"
-            df.to_csv(history_path, mode='a', header=not os.path.exists(history_path))
-            
-            logger.info(f"Updated historical data storage at {history_path}")
-            
+            store = self.data[symbol][timeframe]
+            plan = self.plans[timeframe]
+            if len(store) >= plan.min_bars:  # Need enough data for all requested indicators
+                # Calculate only the indicators strategies declared (shared inputs computed once)
+                store.set_indicators(plan.evaluate(store.close))
+
+                # Publish the latest values for lock-free readers
+                self.snapshots[symbol][timeframe] = IndicatorSnapshot.from_store(store)
+
+            # Every bar goes on the bus; indicator fields stay NaN until the plan has warmed up
+            if self.publisher is not None:
+                self.publisher.publish(symbol, timeframe, store.last_time, store.last_values())
+
         except Exception as e:
             logger.error(f"Error calculating indicators for {symbol} {timeframe}: {str(e)}")
-    
+
+    def _enforce_memory_budget(self):
+        """Evict history beyond what indicators need, coldest stores first, until under budget"""
+        if not self.memory_budget:
+            return
+        total = sum(store.nbytes for frames in self.data.values() for store in frames.values())
+        if total <= self.memory_budget:
+            return
+        stores = sorted(
+            ((store, sym, tf) for sym, frames in self.data.items() for tf, store in frames.items()),
+            key=lambda item: item[0].updated
+        )
+        for store, sym, tf in stores:
+            # Keep enough history that EMAs recomputed on the trimmed window barely move
+            keep = self.plans[tf].settle_bars
+            if len(store) > keep:
+                freed = store.shrink(keep)
+                total -= freed
+                logger.info(f"Memory budget: evicted {sym} {tf} history to the archive, keeping {keep} bars ({freed} bytes freed)")
+            if total <= self.memory_budget:
+                return
+        logger.warning(f"Memory budget of {self.memory_budget} bytes cannot be met, using {total} bytes")
+
+    def flush(self):
+        """Archive the newest (possibly still forming) bar of every store, e.g. at shutdown"""
+        for sym, frames in self.data.items():
+            for tf, store in frames.items():
+                if len(store):
+                    self.archive.append(sym, tf, [store.row(-1)])
+
     def get_data(self, symbol, timeframe):
         """Get data for a specific symbol and timeframe"""
-        return self.data.get(symbol, {}).get(timeframe, pd.DataFrame())
-    
+        store = self.data.get(symbol, {}).get(timeframe)
+        if store is None:
+            return pd.DataFrame(columns=BAR_COLUMNS, dtype=float)
+        return store.frame()
+
+    def get_history(self, symbol, timeframe, start=None):
+        """Archived and in-memory bars together, indexed by epoch seconds"""
+        history = self.archive.read(symbol, timeframe, start=start)
+        store = self.data.get(symbol, {}).get(timeframe)
+        if store is None:
+            return history
+        recent = store.frame(epoch_index=True)[BAR_COLUMNS]
+        combined = pd.concat([history, recent])
+        return combined[~combined.index.duplicated(keep="last")].sort_index()
+
+    def last_bar_time(self, symbol, timeframe):
+        """Open time of the newest stored bar as a UTC Timestamp, or None"""
+        store = self.data.get(symbol, {}).get(timeframe)
+        if store is None or not len(store):
+            return None
+        return pd.Timestamp(store.last_time, unit="s", tz="UTC")
+
+    def get_snapshot(self, symbol, timeframe):
+        """Get the latest indicator snapshot for a symbol and timeframe (None until indicators exist)"""
+        return self.snapshots.get(symbol, {}).get(timeframe)
+
+    def frame_bytes(self):
+        """Memory held by each store, keyed by (symbol, timeframe)"""
+        return {
+            (sym, tf): store.nbytes
+            for sym, frames in list(self.data.items())
+            for tf, store in list(frames.items())
+        }
+
+    def memory_report(self):
+        """Bytes and bars held per instrument, with a per-timeframe breakdown"""
+        report = {}
+        for sym, frames in self.data.items():
+            timeframes = {tf: {"bytes": store.nbytes, "bars": len(store)} for tf, store in frames.items()}
+            report[sym] = {
+                "bytes": sum(entry["bytes"] for entry in timeframes.values()),
+                "bars": sum(entry["bars"] for entry in timeframes.values()),
+                "timeframes": timeframes,
+            }
+        return report
+
     def get_all_data(self):
         """Get all data"""
-        return self.data
\ No newline at end of file
+        return {sym: {tf: store.frame() for tf, store in frames.items()} for sym, frames in self.data.items()}
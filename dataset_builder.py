@@ -0,0 +1,183 @@
+# Training dataset builder.
+#
+# Turns the bar archive into sliding-window feature tensors for model training. Every
+# timeframe is aligned onto the M1 clock: an M1 row at decision time T (the close of
+# that M1 bar) sees, for each higher timeframe, the newest bar that had already closed
+# at T. Indicators are causal kernels over each timeframe's own history, so a window
+# never contains information from after its last row.
+#
+# Output per symbol in DATASET_DIR (raw little-endian arrays, appended in place):
+#     {sym}_X.f32   windows x DATASET_WINDOW x features   float32
+#     {sym}_y.f32   windows                               float32 log return DATASET_HORIZON M1 bars ahead
+#     {sym}_t.i64   windows                               int64 decision time (epoch seconds) of the last row
+#     {sym}_meta.json  shapes, feature names and the last decision time written
+# load() opens them as np.memmap. Re-running appends only windows newer than the last one.
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from config import (
+    logger, SYMBOLS, TIMEFRAMES, DATASET_DIR, DATASET_WINDOW, DATASET_HORIZON, DATASET_STRIDE,
+    DATASET_WORKERS
+)
+from bar_archive import BarArchive
+from indicator_graph import IndicatorPlan
+from historical_data_manager import BAR_SECONDS
+
+# Per-timeframe columns in every row: the bar close plus its indicators
+COLUMNS = ["close", "ema_fast", "ema_slow", "histogram", "rsi", "bb_upper", "bb_lower"]
+INDICATORS = [col for col in COLUMNS if col != "close"]
+BASE_TIMEFRAME = "M1"
+WRITE_BATCH = 4096  # windows materialized per write
+
+
+def feature_names(timeframes=TIMEFRAMES):
+    """Column names of one window row, in the order align() lays them out"""
+    ordered = [BASE_TIMEFRAME] + [tf for tf in timeframes if tf != BASE_TIMEFRAME]
+    return [f"{tf}_{col}" for tf in ordered for col in COLUMNS]
+
+
+def _timeframe_features(bars, timeframe):
+    """(close times, feature matrix) for one timeframe's archived bars"""
+    close = bars["close"].to_numpy(dtype=np.float64)
+    values = IndicatorPlan(INDICATORS).evaluate(close)
+    features = np.column_stack([close] + [values[name] for name in INDICATORS])
+    close_times = bars.index.to_numpy(dtype=np.int64) + BAR_SECONDS[timeframe]
+    return close_times, features
+
+
+def align(frames):
+    """
+    Align every timeframe onto the base timeframe's clock.
+    Args:
+        frames (dict): timeframe -> archived bars (index: open time in epoch seconds)
+    Returns:
+        (decision times, base closes, feature matrix rows x (timeframes x COLUMNS))
+    """
+    base_times, base_features = _timeframe_features(frames[BASE_TIMEFRAME], BASE_TIMEFRAME)
+    blocks = [base_features]
+    for tf, bars in frames.items():
+        if tf == BASE_TIMEFRAME:
+            continue
+        block = np.full((len(base_times), len(COLUMNS)), np.nan)
+        blocks.append(block)
+        if not len(bars):
+            continue
+        close_times, features = _timeframe_features(bars, tf)
+        # Newest bar closed at or before each decision time; -1 means none yet
+        idx = np.searchsorted(close_times, base_times, side="right") - 1
+        seen = idx >= 0
+        block[seen] = features[idx[seen]]
+    return base_times, base_features[:, 0], np.hstack(blocks)
+
+
+def build_symbol(symbol, archive_dir=None, out_dir=DATASET_DIR, window=DATASET_WINDOW,
+                 horizon=DATASET_HORIZON, stride=DATASET_STRIDE, rebuild=False):
+    """Append the windows of one symbol not written yet. Returns the number of new windows."""
+    archive = BarArchive(archive_dir) if archive_dir else BarArchive()
+    frames = {tf: archive.read(symbol, tf) for tf in TIMEFRAMES}
+    if len(frames[BASE_TIMEFRAME]) < window + horizon:
+        logger.info(f"Dataset {symbol}: not enough {BASE_TIMEFRAME} bars archived")
+        return 0
+
+    names = feature_names(frames)
+    paths = {kind: os.path.join(out_dir, f"{symbol}_{kind}") for kind in ("X.f32", "y.f32", "t.i64", "meta.json")}
+    meta = _read_meta(paths["meta.json"])
+    expected = {"window": window, "horizon": horizon, "stride": stride, "features": names}
+    if meta and any(meta.get(k) != v for k, v in expected.items()):
+        logger.warning(f"Dataset {symbol}: settings changed since the last build, rebuilding")
+        rebuild = True
+    if rebuild or not meta:
+        for kind in ("X.f32", "y.f32", "t.i64"):
+            if os.path.exists(paths[kind]):
+                os.remove(paths[kind])
+        meta = dict(expected, count=0, last_time=None)
+
+    times, closes, features = align(frames)
+    n = len(times)
+
+    # Window k covers rows k .. k+window-1 and is labelled from its last row
+    ends = np.arange(window - 1, n - horizon)
+    invalid = np.concatenate([[0], np.cumsum(~np.isfinite(features).all(axis=1))])
+    ok = invalid[ends + 1] - invalid[ends + 1 - window] == 0
+    if stride > 1:
+        ok &= (ends - (window - 1)) % stride == 0
+    if meta["last_time"] is not None:
+        ok &= times[ends] > meta["last_time"]
+    ends = ends[ok]
+    if not len(ends):
+        logger.info(f"Dataset {symbol}: up to date ({meta['count']} windows)")
+        return 0
+
+    labels = np.log(closes[ends + horizon] / closes[ends]).astype(np.float32)
+    views = sliding_window_view(features.astype(np.float32), window, axis=0)  # (n-window+1, features, window)
+    os.makedirs(out_dir, exist_ok=True)
+    # Drop rows a crashed run appended after the last meta write, so files and meta agree
+    row_bytes = {"X.f32": window * len(names) * 4, "y.f32": 4, "t.i64": 8}
+    for kind, size in row_bytes.items():
+        with open(paths[kind], "ab") as f:
+            f.truncate(meta["count"] * size)
+    with open(paths["X.f32"], "ab") as fx:
+        for i in range(0, len(ends), WRITE_BATCH):
+            batch = ends[i:i + WRITE_BATCH] - (window - 1)
+            fx.write(np.ascontiguousarray(views[batch].transpose(0, 2, 1)).tobytes())
+    with open(paths["y.f32"], "ab") as fy:
+        fy.write(labels.tobytes())
+    with open(paths["t.i64"], "ab") as ft:
+        ft.write(times[ends].astype(np.int64).tobytes())
+
+    # Meta last: rows written before a crash here are truncated away by the next run
+    meta["count"] += len(ends)
+    meta["last_time"] = int(times[ends[-1]])
+    tmp_path = paths["meta.json"] + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_path, paths["meta.json"])
+    logger.info(f"Dataset {symbol}: appended {len(ends)} windows ({meta['count']} total)")
+    return len(ends)
+
+
+def build(symbols=SYMBOLS, workers=DATASET_WORKERS, **kwargs):
+    """Build or extend the datasets of several symbols in parallel processes"""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {sym: pool.submit(build_symbol, sym, **kwargs) for sym in symbols}
+        results = {}
+        for sym, future in futures.items():
+            try:
+                results[sym] = future.result()
+            except Exception as e:
+                logger.error(f"Error building dataset for {sym}: {str(e)}")
+                results[sym] = None
+    return results
+
+
+def load(symbol, out_dir=DATASET_DIR):
+    """Memory-map a symbol's dataset: (X, y, t, meta)"""
+    meta = _read_meta(os.path.join(out_dir, f"{symbol}_meta.json"))
+    if not meta:
+        raise FileNotFoundError(f"No dataset for {symbol} in {out_dir}")
+    count, window, n_features = meta["count"], meta["window"], len(meta["features"])
+    X = np.memmap(os.path.join(out_dir, f"{symbol}_X.f32"), dtype=np.float32, mode="r",
+                  shape=(count, window, n_features))
+    y = np.memmap(os.path.join(out_dir, f"{symbol}_y.f32"), dtype=np.float32, mode="r", shape=(count,))
+    t = np.memmap(os.path.join(out_dir, f"{symbol}_t.i64"), dtype=np.int64, mode="r", shape=(count,))
+    return X, y, t, meta
+
+
+def _read_meta(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Build sliding-window training tensors from the bar archive")
+    parser.add_argument("--symbols", nargs="+", default=SYMBOLS)
+    parser.add_argument("--workers", type=int, default=DATASET_WORKERS)
+    parser.add_argument("--rebuild", action="store_true", help="discard existing datasets first")
+    args = parser.parse_args()
+    for sym, count in build(args.symbols, args.workers, rebuild=args.rebuild).items():
+        print(f"{sym}: {'failed' if count is None else f'{count} new windows'}")
@@ -1,14 +1,35 @@
-from datetime import datetime, timedelta
-import pandas as pd
-from ibapi.contract import Contract
-from config import logger
+from datetime import timedelta
+import math
+import time
+from config import logger, TIMEFRAMES
+from scheduler import PRIORITY_LIVE, PRIORITY_BACKFILL
+
+# Seconds per bar for each timeframe, used to size gap backfills
+BAR_SECONDS = {
+    "M1": 60,
+    "M15": 15 * 60,
+    "H1": 60 * 60,
+    "H4": 4 * 60 * 60,
+    "D1": 24 * 60 * 60,
+}
+
+# History loaded when a stream is first opened; enough bars for every indicator
+DEFAULT_DURATIONS = {
+    "M1": "1 D",
+    "M15": "1 W",
+    "H1": "1 M",
+    "H4": "3 M",
+    "D1": "1 Y",
+}
 
 class HistoricalDataManager:
     def __init__(self, connection, data_handler):
         self.connection = connection
         self.data_handler = data_handler
-        
-    def request_historical_data(self, symbol, timeframe, duration="1 M", bar_size="1 min"):
+        self.subscriptions = {}  # reqId -> {"symbol", "timeframe", "bar_size"} for keepUpToDate streams
+
+    def request_historical_data(self, symbol, timeframe, duration="1 M", bar_size="1 min", keep_up_to_date=False,
+                                priority=PRIORITY_BACKFILL):
         """
         Request historical data for a forex pair
         Args:
@@ -16,33 +37,90 @@ class HistoricalDataManager:
             timeframe (str): One of TIMEFRAMES keys from config
             duration (str): IBKR duration string (e.g., '1 M', '100 D')
             bar_size (str): Bar size (e.g., '1 min', '1 hour')
+            keep_up_to_date (bool): Keep streaming bar updates after the history
+            priority (int): Scheduler priority (PRIORITY_LIVE for gaps the strategy trades on)
         """
-        contract = self._create_forex_contract(symbol)
         req_id = self._generate_request_id(symbol, timeframe)
-        
-        self.connection.reqHistoricalData(
-            reqId=req_id,
-            contract=contract,
-            endDateTime="",
-            durationStr=duration,
-            barSizeSetting=bar_size,
-            whatToShow="MIDPOINT",
-            useRTH=1,
-            formatDate=1,
-            keepUpToDate=False,
-            chartOptions=[]
-        )
-        logger.info(f"Requested historical data for {symbol} ({timeframe})")
+
+        def send():
+            self.connection.reqHistoricalData(
+                reqId=req_id,
+                contract=self._create_forex_contract(symbol),
+                endDateTime="",
+                durationStr=duration,
+                barSizeSetting=bar_size,
+                whatToShow="MIDPOINT",
+                useRTH=1,
+                formatDate=1,
+                keepUpToDate=keep_up_to_date,
+                chartOptions=[]
+            )
+            logger.info(f"Requested historical data for {symbol} ({timeframe}, {duration})")
+
+        if keep_up_to_date:
+            self.subscriptions[req_id] = {"symbol": symbol, "timeframe": timeframe, "bar_size": bar_size}
+        # One request per stream may be pending; a queued request already covers the same bars
+        if not self.connection.scheduler.submit("historical", ("historical", req_id), send, priority, contract_key=symbol):
+            logger.info(f"Historical data for {symbol} ({timeframe}) already pending")
+
+    def on_historical_data_end(self, reqId):
+        """The initial history for a request has arrived; free its pending slot"""
+        self.connection.scheduler.complete(("historical", reqId))
+
+    def on_error(self, reqId, errorCode, errorString):
+        """Re-queue pacing violations, drop other failed requests"""
+        key = ("historical", reqId)
+        if not self.connection.scheduler.is_pending(key):
+            return
+        if errorCode == 162 and "pacing" in errorString.lower():
+            self.connection.scheduler.retry(key)
+        elif errorCode not in (2104, 2106, 2107, 2108, 2158):
+            self.connection.scheduler.complete(key)
+
+    def subscribe_bars(self, symbol, timeframe, duration=None):
+        """Load history for a symbol/timeframe and keep it up to date"""
+        duration = duration or DEFAULT_DURATIONS.get(timeframe, "1 M")
+        self.request_historical_data(symbol, timeframe, duration, TIMEFRAMES[timeframe], keep_up_to_date=True)
+
+    def is_subscribed(self, symbol, timeframe):
+        return self._generate_request_id(symbol, timeframe) in self.subscriptions
+
+    def resubscribe(self):
+        """Re-issue keepUpToDate streams after a reconnect, backfilling only the missing bars"""
+        for req_id, sub in list(self.subscriptions.items()):
+            symbol, timeframe = sub["symbol"], sub["timeframe"]
+            duration = self._gap_duration(symbol, timeframe)
+            self.request_historical_data(symbol, timeframe, duration, sub["bar_size"], keep_up_to_date=True,
+                                         priority=PRIORITY_LIVE)
+            logger.info(f"Resubscribed {symbol} ({timeframe}), backfilling {duration}")
+
+    def cancel_streams(self):
+        """Cancel the keepUpToDate streams at IB, keeping them registered for resubscribe()"""
+        for req_id in list(self.subscriptions):
+            self.connection.scheduler.cancel(("historical", req_id))
+            self.connection.cancelHistoricalData(req_id)
+
+    def cancel_all(self):
+        """Cancel all keepUpToDate streams"""
+        self.cancel_streams()
+        self.subscriptions.clear()
+
+    def _gap_duration(self, symbol, timeframe):
+        """IB duration string covering the bars missed since the last stored bar"""
+        last = self.data_handler.last_bar_time(symbol, timeframe)
+        if last is None:
+            return DEFAULT_DURATIONS.get(timeframe, "1 M")
+        # In epoch seconds, so the host's time zone can't skew the gap
+        # Include the last stored bar again, it may have been incomplete
+        gap = time.time() - last.timestamp() + BAR_SECONDS.get(timeframe, 60)
+        if gap <= 24 * 60 * 60:
+            return f"{max(60, int(math.ceil(gap)))} S"
+        return f"{int(math.ceil(gap / timedelta(days=1).total_seconds()))} D"
 
     def _create_forex_contract(self, symbol):
-        contract = Contract()
-        contract.symbol = symbol[:3]
-        contract.secType = "CASH"
-        contract.currency = symbol[3:]
-        contract.exchange = "IDEALPRO"
-        return contract
+        return self.connection.contracts.get(symbol)
 
     def _generate_request_id(self, symbol, timeframe):
         symbol_index = list(self.data_handler.data.keys()).index(symbol)
         timeframe_index = list(self.data_handler.data[symbol].keys()).index(timeframe)
-        return symbol_index * 100 + timeframe_index
\ No newline at end of file
+        return symbol_index * 100 + timeframe_index
@@ -0,0 +1,281 @@
+from datetime import datetime, timezone
+from threading import Event, Lock
+import json
+import os
+import pandas as pd
+from config import (
+    logger, SYMBOLS, TIMEFRAMES, DOWNLOAD_CHECKPOINT_PATH, DOWNLOAD_MAX_IN_FLIGHT,
+    DOWNLOAD_REQ_ID_BASE, DOWNLOAD_REQ_ID_RANGE
+)
+from scheduler import PRIORITY_RESEARCH
+from bar_archive import bar_time_to_epoch
+
+DAY = 24 * 60 * 60
+
+# Largest request window IB serves per bar size: (durationStr, seconds covered)
+CHUNKS = {
+    "M1": ("86400 S", DAY),
+    "M15": ("7 D", 7 * DAY),
+    "H1": ("30 D", 30 * DAY),
+    "H4": ("30 D", 30 * DAY),
+    "D1": ("365 D", 365 * DAY),
+}
+
+# Error 162 texts meaning the window simply has no bars (weekends, holidays)
+NO_DATA_MESSAGES = ("returned no data", "no data")
+
+
+class HistoryDownloader:
+    """
+    Downloads deep history into the bar archive in IB-sized chunks.
+
+    [start, end] is cut into chunks on a fixed grid (multiples of the chunk length since
+    the epoch), so the same chunk has the same identity across runs. Chunks go through
+    the request scheduler at research priority, interleaved across symbols, with a cap
+    on requests in flight. Finished chunks are checkpointed to JSON; a restarted download
+    skips them and only fetches what is missing.
+    """
+
+    def __init__(self, connection, archive, checkpoint_path=DOWNLOAD_CHECKPOINT_PATH,
+                 max_in_flight=DOWNLOAD_MAX_IN_FLIGHT):
+        self.connection = connection
+        self.archive = archive
+        self.checkpoint_path = checkpoint_path
+        self.max_in_flight = max_in_flight
+        self.lock = Lock()
+        self.done_event = Event()
+        self.done_event.set()
+        self.completed = self._load_checkpoint()  # timeframe -> symbol -> set of chunk end times
+        self.queue = []       # chunks waiting to be submitted: (symbol, timeframe, chunk end)
+        self.in_flight = {}   # reqId -> {"chunk", "bars"}
+        self.failed = []
+        self.total = 0
+        self.next_id = 0
+
+    # --- Planning ---
+
+    @staticmethod
+    def chunks(timeframe, start, end):
+        """Grid-aligned chunk end times (epoch seconds) covering [start, end], newest first"""
+        length = CHUNKS[timeframe][1]
+        first = (int(start) // length + 1) * length
+        last = -(-int(end) // length) * length  # ceil to the grid
+        return list(range(last, first - 1, -length))
+
+    def download(self, symbols, timeframe, start, end=None):
+        """
+        Queue every missing chunk of [start, end] for the given symbols. Returns immediately.
+        Args:
+            symbols (list): Currency pairs (e.g. ['EURUSD'])
+            timeframe (str): One of TIMEFRAMES keys from config
+            start, end: Anything pandas can parse as a UTC time; end defaults to now
+        Returns:
+            Number of chunks queued
+        """
+        if timeframe not in CHUNKS:
+            raise ValueError(f"Unknown timeframe: {timeframe}")
+        start = _to_epoch(start)
+        end = _to_epoch(end) if end is not None else int(datetime.now(timezone.utc).timestamp())
+
+        with self.lock:
+            done = self.completed.setdefault(timeframe, {})
+            active = {job["chunk"] for job in self.in_flight.values()} | set(self.queue)
+            # Newest first, round-robin across symbols so every pair progresses together
+            queued = [
+                (sym, timeframe, chunk_end)
+                for chunk_end in self.chunks(timeframe, start, end)
+                for sym in symbols
+                if chunk_end not in done.get(sym, ()) and (sym, timeframe, chunk_end) not in active
+            ]
+            self.queue.extend(queued)
+            self.total += len(queued)
+            if self.queue or self.in_flight:
+                self.done_event.clear()
+        logger.info(f"History download: {len(queued)} {timeframe} chunks queued for {', '.join(symbols)}")
+        self._pump()
+        return len(queued)
+
+    def wait(self, timeout=None):
+        """Block until every queued chunk has finished (or failed). Returns False on timeout."""
+        return self.done_event.wait(timeout)
+
+    def progress(self):
+        with self.lock:
+            return {
+                "total": self.total,
+                "queued": len(self.queue),
+                "in_flight": len(self.in_flight),
+                "failed": len(self.failed),
+                "done": self.total - len(self.queue) - len(self.in_flight) - len(self.failed),
+            }
+
+    # --- Requests ---
+
+    def _pump(self):
+        """Hand chunks to the scheduler while below the in-flight cap"""
+        while True:
+            with self.lock:
+                if not self.queue or len(self.in_flight) >= self.max_in_flight:
+                    return
+                chunk = self.queue.pop(0)
+                req_id = DOWNLOAD_REQ_ID_BASE + self.next_id % DOWNLOAD_REQ_ID_RANGE
+                self.next_id += 1
+                self.in_flight[req_id] = {"chunk": chunk, "bars": []}
+            self._submit(req_id, chunk)
+
+    def _submit(self, req_id, chunk):
+        sym, timeframe, chunk_end = chunk
+        duration = CHUNKS[timeframe][0]
+        end_text = datetime.fromtimestamp(chunk_end, timezone.utc).strftime("%Y%m%d-%H:%M:%S")
+
+        def send():
+            self.connection.reqHistoricalData(
+                reqId=req_id,
+                contract=self.connection.contracts.get(sym),
+                endDateTime=end_text,
+                durationStr=duration,
+                barSizeSetting=TIMEFRAMES[timeframe],
+                whatToShow="MIDPOINT",
+                useRTH=1,
+                formatDate=1,
+                keepUpToDate=False,
+                chartOptions=[]
+            )
+
+        self.connection.scheduler.submit("historical", ("download", req_id), send, PRIORITY_RESEARCH, contract_key=sym)
+
+    def owns(self, reqId):
+        return DOWNLOAD_REQ_ID_BASE <= reqId < DOWNLOAD_REQ_ID_BASE + DOWNLOAD_REQ_ID_RANGE
+
+    def on_bar(self, reqId, bar):
+        job = self.in_flight.get(reqId)
+        if job is None:
+            return
+        job["bars"].append((bar_time_to_epoch(bar.date), bar.open, bar.high, bar.low, bar.close,
+                            bar.volume if hasattr(bar, 'volume') else 0))
+
+    def on_end(self, reqId):
+        """A chunk arrived in full: archive it and checkpoint"""
+        with self.lock:
+            job = self.in_flight.pop(reqId, None)
+        if job is None:
+            return
+        self.connection.scheduler.complete(("download", reqId))
+        sym, timeframe, _ = job["chunk"]
+        self.archive.append(sym, timeframe, job["bars"])
+        self._finish(job["chunk"])
+
+    def on_error(self, reqId, errorCode, errorString):
+        """Re-queue pacing violations, checkpoint empty windows, record other failures"""
+        if not self.owns(reqId) or reqId not in self.in_flight:
+            return
+        key = ("download", reqId)
+        if errorCode == 162 and "pacing" in errorString.lower():
+            self.in_flight[reqId]["bars"] = []
+            self.connection.scheduler.retry(key)
+            return
+        if errorCode in (2104, 2106, 2107, 2108, 2158):
+            return
+        with self.lock:
+            job = self.in_flight.pop(reqId)
+        self.connection.scheduler.complete(key)
+        if errorCode == 162 and any(msg in errorString.lower() for msg in NO_DATA_MESSAGES):
+            self._finish(job["chunk"])
+            return
+        with self.lock:
+            self.failed.append(job["chunk"])
+        logger.error(f"History chunk {job['chunk']} failed: {errorCode} {errorString}")
+        self._pump()
+        self._check_done()
+
+    def restart_in_flight(self):
+        """After a reconnect, requests that were in flight are lost; send them again"""
+        with self.lock:
+            jobs = list(self.in_flight.items())
+            self.in_flight.clear()
+            self.queue[:0] = [job["chunk"] for _, job in jobs]
+        for req_id, _ in jobs:
+            self.connection.scheduler.complete(("download", req_id))
+        if jobs:
+            logger.info(f"History download: re-sending {len(jobs)} chunks after reconnect")
+        self._pump()
+
+    def _finish(self, chunk):
+        sym, timeframe, chunk_end = chunk
+        # A chunk reaching into the future is still filling up; fetch it again next run
+        if chunk_end <= datetime.now(timezone.utc).timestamp():
+            with self.lock:
+                self.completed.setdefault(timeframe, {}).setdefault(sym, set()).add(chunk_end)
+                self._save_checkpoint()
+        self._pump()
+        self._check_done()
+
+    def _check_done(self):
+        with self.lock:
+            if self.queue or self.in_flight or self.done_event.is_set():
+                return
+            self.done_event.set()
+            failed = len(self.failed)
+        logger.info(f"History download finished: {self.total - failed} chunks, {failed} failed")
+
+    # --- Checkpoint ---
+
+    def _load_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path):
+            return {}
+        try:
+            with open(self.checkpoint_path) as f:
+                data = json.load(f)
+            return {tf: {sym: set(ends) for sym, ends in syms.items()} for tf, syms in data.items()}
+        except Exception as e:
+            logger.error(f"Error loading download checkpoint: {str(e)}")
+            return {}
+
+    def _save_checkpoint(self):
+        try:
+            tmp_path = self.checkpoint_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({tf: {sym: sorted(ends) for sym, ends in syms.items()}
+                           for tf, syms in self.completed.items()}, f)
+            os.replace(tmp_path, self.checkpoint_path)
+        except Exception as e:
+            logger.error(f"Error saving download checkpoint: {str(e)}")
+
+
+def _to_epoch(value):
+    ts = pd.Timestamp(value)
+    if ts.tz is None:
+        ts = ts.tz_localize("UTC")
+    return ts.value // 10**9
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(description="Download deep history into the bar archive (resumable)")
+    parser.add_argument("--timeframe", default="M1", choices=list(CHUNKS))
+    parser.add_argument("--start", required=True, help="e.g. 2022-01-01")
+    parser.add_argument("--end", default=None, help="defaults to now")
+    parser.add_argument("--symbols", nargs="+", default=SYMBOLS)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7497)
+    parser.add_argument("--client-id", type=int, default=1)
+    args = parser.parse_args()
+
+    from connection import IBConnection
+    from session import SessionManager
+
+    # Data-only connection next to the trading bot: no strategy loop
+    app = IBConnection(trading=False)
+    session = SessionManager(app, args.host, args.port, client_id=args.client_id)
+    if not session.start():
+        raise SystemExit("Failed to connect")
+    try:
+        app.downloader.download(args.symbols, args.timeframe, args.start, args.end)
+        while not app.downloader.wait(30):
+            logger.info(f"History download progress: {app.downloader.progress()}")
+    except KeyboardInterrupt:
+        logger.info("Interrupted; completed chunks are checkpointed, rerun to resume")
+    finally:
+        session.stop()
+        time.sleep(1)
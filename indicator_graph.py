@@ -0,0 +1,77 @@
+import numpy as np
+import indicators
+from config import FAST_EMA, SLOW_EMA, RSI_PERIOD, BB_PERIOD, BB_STD_DEV, EMA_SETTLE_SPANS
+
+
+class IndicatorNode:
+    """
+    One indicator column: its inputs, how to compute it and the bars it needs to be meaningful.
+    settle is the history after which older bars no longer change the newest value
+    (EMAs depend on all history; windowed indicators only on their window).
+    """
+
+    def __init__(self, name, deps, fn, warmup, settle=None):
+        self.name = name
+        self.deps = deps
+        self.fn = fn
+        self.warmup = warmup
+        self.settle = settle or warmup
+
+
+# Every indicator DataHandler can compute, as NumPy kernels over the close array.
+# Intermediate nodes (ema12, ema26, macd, bb_std...) are computed once and shared by
+# everything that depends on them.
+NODES = {node.name: node for node in [
+    IndicatorNode("ema_fast", [], lambda c, v: indicators.ema(c, span=FAST_EMA), FAST_EMA, EMA_SETTLE_SPANS * FAST_EMA),
+    IndicatorNode("ema_slow", [], lambda c, v: indicators.ema(c, span=SLOW_EMA), SLOW_EMA, EMA_SETTLE_SPANS * SLOW_EMA),
+    IndicatorNode("ema12", [], lambda c, v: indicators.ema(c, span=12), 12, EMA_SETTLE_SPANS * 12),
+    IndicatorNode("ema26", [], lambda c, v: indicators.ema(c, span=26), 26, EMA_SETTLE_SPANS * 26),
+    IndicatorNode("macd", ["ema12", "ema26"], lambda c, v: v["ema12"] - v["ema26"], 26),
+    IndicatorNode("signal", ["macd"], lambda c, v: indicators.ema(v["macd"], span=9), 26, EMA_SETTLE_SPANS * 9),
+    IndicatorNode("histogram", ["macd", "signal"], lambda c, v: v["macd"] - v["signal"], 26),
+    IndicatorNode("rsi", [], lambda c, v: indicators.rsi(c, RSI_PERIOD), RSI_PERIOD),
+    IndicatorNode("bb_middle", [], lambda c, v: indicators.sma(c, BB_PERIOD), BB_PERIOD),
+    IndicatorNode("bb_std", [], lambda c, v: indicators.rolling_std(c, BB_PERIOD), BB_PERIOD),
+    IndicatorNode("bb_upper", ["bb_middle", "bb_std"], lambda c, v: v["bb_middle"] + v["bb_std"] * BB_STD_DEV, BB_PERIOD),
+    IndicatorNode("bb_lower", ["bb_middle", "bb_std"], lambda c, v: v["bb_middle"] - v["bb_std"] * BB_STD_DEV, BB_PERIOD),
+]}
+
+ALL_INDICATORS = list(NODES)
+
+
+class IndicatorPlan:
+    """Minimal computation order for a set of requested indicators on one timeframe"""
+
+    def __init__(self, outputs, lookback=0):
+        unknown = set(outputs) - set(NODES)
+        if unknown:
+            raise ValueError(f"Unknown indicators: {', '.join(sorted(unknown))}")
+        self.outputs = set(outputs)
+        self.order = []
+        seen = set()
+
+        def visit(name):
+            if name in seen:
+                return
+            seen.add(name)
+            for dep in NODES[name].deps:
+                visit(dep)
+            self.order.append(NODES[name])
+
+        for name in sorted(self.outputs):
+            visit(name)
+        self.min_bars = max([lookback] + [node.warmup for node in self.order])
+        # Floor for memory budget eviction: trimming to it leaves the outputs unchanged
+        # (within EMA_SETTLE_SPANS tolerance). Dependencies are in order, so the max covers chains.
+        self.settle_bars = max([self.min_bars] + [node.settle for node in self.order])
+
+    def evaluate(self, close):
+        """Compute the plan on close prices; returns only the requested columns as arrays"""
+        close = np.ascontiguousarray(close, dtype=np.float64)
+        values = {}
+        for node in self.order:
+            values[node.name] = node.fn(close, values)
+        return {name: values[name] for name in self.outputs}
+
+    def __repr__(self):
+        return f"IndicatorPlan(outputs={sorted(self.outputs)}, steps={[n.name for n in self.order]}, min_bars={self.min_bars}, settle_bars={self.settle_bars})"
@@ -0,0 +1,312 @@
+import math
+import numpy as np
+
+# NumPy indicator kernels.
+#
+# All kernels take contiguous float64 arrays, 1D (time) or 2D (symbols x time, time on
+# the last axis), accept an out= buffer of the same shape and match the pandas
+# formulas previously used in DataHandler (ewm(span).mean() is the adjusted EWMA,
+# rolling() leaves the first window-1 values NaN, std uses ddof=1).
+#
+# Run `python indicators.py` to validate against pandas and benchmark.
+
+# Largest growth factor allowed inside one block of the EWMA scan (keeps float64 exact enough)
+_SCAN_GROWTH = 1e12
+
+
+def _as_float(x):
+    return np.ascontiguousarray(x, dtype=np.float64)
+
+
+def _out(out, like):
+    if out is None:
+        return np.empty_like(like)
+    if out.shape != like.shape:
+        raise ValueError(f"out has shape {out.shape}, expected {like.shape}")
+    return out
+
+
+def _scan(z, w, out, carry=None):
+    """
+    Linear recurrence s_t = z_t + w * s_{t-1} along the last axis, vectorized per block:
+    inside a block s_{k} = w^k * (w * carry + cumsum(z_j * w^-j)), with w^-k bounded.
+    """
+    n = z.shape[-1]
+    if carry is None:
+        carry = np.zeros(z.shape[:-1])
+    if w == 0.0:
+        out[...] = z
+        return out
+    block = max(1, int(math.log(_SCAN_GROWTH) / -math.log(w)))
+    powers = w ** np.arange(min(block, n))
+    inv_powers = 1.0 / powers
+    for start in range(0, n, block):
+        end = min(start + block, n)
+        k = end - start
+        seg = out[..., start:end]
+        np.multiply(z[..., start:end], inv_powers[:k], out=seg)
+        np.cumsum(seg, axis=-1, out=seg)
+        seg += (w * carry)[..., None]
+        seg *= powers[:k]
+        carry = seg[..., -1].copy()
+    return out
+
+
+def ema(x, span=None, alpha=None, adjust=True, out=None):
+    """Exponential moving average, equivalent to pandas ewm(span=..., adjust=...).mean() on finite input"""
+    x = _as_float(x)
+    out = _out(out, x)
+    if alpha is None:
+        alpha = 2.0 / (span + 1.0)
+    w = 1.0 - alpha
+    if adjust:
+        _scan(x, w, out)
+        n = x.shape[-1]
+        # Sum of weights 1 + w + ... + w^t
+        weights = (1.0 - w ** np.arange(1, n + 1)) / alpha
+        out /= weights
+    else:
+        z = x * alpha
+        z[..., 0] = x[..., 0]
+        _scan(z, w, out)
+    return out
+
+
+def _window_sum(x, window, out):
+    """out[..., i] = sum of x[..., i:i + window]; window shifted adds over contiguous slices"""
+    m = x.shape[-1] - window + 1
+    out[...] = x[..., :m]
+    for k in range(1, window):
+        out += x[..., k:k + m]
+    return out
+
+
+def sma(x, window, out=None):
+    """Rolling mean, NaN until a full window is available"""
+    x = _as_float(x)
+    out = _out(out, x)
+    out[..., :window - 1] = np.nan
+    if x.shape[-1] >= window:
+        full = out[..., window - 1:]
+        _window_sum(x, window, full)
+        full /= window
+    return out
+
+
+def rolling_std(x, window, ddof=1, out=None):
+    """Rolling standard deviation (sample by default, like pandas), two-pass around the window mean"""
+    x = _as_float(x)
+    out = _out(out, x)
+    out[..., :window - 1] = np.nan
+    if x.shape[-1] >= window:
+        m = x.shape[-1] - window + 1
+        mean = _window_sum(x, window, np.empty(x.shape[:-1] + (m,)))
+        mean /= window
+        full = out[..., window - 1:]
+        full[...] = 0.0
+        dev = np.empty_like(mean)
+        for k in range(window):
+            np.subtract(x[..., k:k + m], mean, out=dev)
+            dev *= dev
+            full += dev
+        full /= window - ddof
+        np.sqrt(full, out=full)
+    return out
+
+
+def macd(close, fast=12, slow=26, signal=9, out=None):
+    """MACD line, signal line and histogram. out is an optional (macd, signal, histogram) tuple."""
+    close = _as_float(close)
+    macd_out, signal_out, hist_out = out if out is not None else (None, None, None)
+    macd_out = ema(close, span=fast, out=macd_out)
+    macd_out -= ema(close, span=slow)
+    signal_out = ema(macd_out, span=signal, out=signal_out)
+    hist_out = np.subtract(macd_out, signal_out, out=_out(hist_out, close))
+    return macd_out, signal_out, hist_out
+
+
+def _gains_losses(close):
+    """Per-bar gains and losses; the first bar counts as 0 like pandas where() on the NaN diff"""
+    delta = np.zeros_like(close)
+    np.subtract(close[..., 1:], close[..., :-1], out=delta[..., 1:])
+    gain = np.maximum(delta, 0.0)
+    loss = np.maximum(-delta, 0.0)
+    return gain, loss
+
+
+def _wilder(x, period, out):
+    """Wilder smoothing: SMA seed over bars 1..period, then avg = avg + (x - avg) / period"""
+    out[..., :period] = np.nan
+    if x.shape[-1] <= period:
+        return out
+    z = x[..., period:] / period
+    z[..., 0] = x[..., 1:period + 1].mean(axis=-1)
+    _scan(z, 1.0 - 1.0 / period, out[..., period:])
+    return out
+
+
+def rsi(close, period=14, method="sma", out=None):
+    """Relative Strength Index with simple ("sma") or Wilder ("wilder") averaging"""
+    close = _as_float(close)
+    out = _out(out, close)
+    gain, loss = _gains_losses(close)
+    if method == "sma":
+        avg_gain, avg_loss = sma(gain, period), sma(loss, period)
+    elif method == "wilder":
+        avg_gain, avg_loss = _wilder(gain, period, np.empty_like(gain)), _wilder(loss, period, np.empty_like(loss))
+    else:
+        raise ValueError(f"Unknown RSI method: {method}")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        np.divide(avg_gain, avg_loss, out=out)
+        out += 1.0
+        np.divide(100.0, out, out=out)
+        np.subtract(100.0, out, out=out)
+    return out
+
+
+def bollinger(close, period=20, num_std=2, out=None):
+    """Bollinger middle, upper and lower bands. out is an optional (middle, upper, lower) tuple."""
+    close = _as_float(close)
+    middle, upper, lower = out if out is not None else (None, None, None)
+    middle = sma(close, period, out=middle)
+    std = rolling_std(close, period)
+    std *= num_std
+    upper = np.add(middle, std, out=_out(upper, close))
+    lower = np.subtract(middle, std, out=_out(lower, close))
+    return middle, upper, lower
+
+
+def true_range(high, low, close, out=None):
+    """True range; the first bar is high - low"""
+    high, low, close = _as_float(high), _as_float(low), _as_float(close)
+    out = _out(out, high)
+    np.subtract(high, low, out=out)
+    prev_close = close[..., :-1]
+    np.maximum(out[..., 1:], np.abs(high[..., 1:] - prev_close), out=out[..., 1:])
+    np.maximum(out[..., 1:], np.abs(low[..., 1:] - prev_close), out=out[..., 1:])
+    return out
+
+
+def atr(high, low, close, period=14, method="sma", out=None):
+    """Average true range with simple ("sma") or Wilder ("wilder") averaging"""
+    tr = true_range(high, low, close)
+    if method == "sma":
+        return sma(tr, period, out=out)
+    if method == "wilder":
+        # Seed with the first full window including bar 0, as most charting packages do
+        out = _out(out, tr)
+        out[..., :period - 1] = np.nan
+        if tr.shape[-1] >= period:
+            z = tr[..., period - 1:] / period
+            z[..., 0] = tr[..., :period].mean(axis=-1)
+            _scan(z, 1.0 - 1.0 / period, out[..., period - 1:])
+        return out
+    raise ValueError(f"Unknown ATR method: {method}")
+
+
+# --- Validation and benchmark against the pandas reference ---
+
+def _pandas_reference(close, high, low, period=14, bb_period=20, bb_std=2):
+    import pandas as pd
+    c, h, l = pd.Series(close), pd.Series(high), pd.Series(low)
+    delta = c.diff()
+    gain = delta.where(delta > 0, 0)
+    loss = -delta.where(delta < 0, 0)
+    rs = gain.rolling(period).mean() / loss.rolling(period).mean()
+    seed_gain, seed_loss = gain.iloc[1:period + 1].mean(), loss.iloc[1:period + 1].mean()
+    wilder_gain = pd.concat([pd.Series([seed_gain]), gain.iloc[period + 1:]]).ewm(alpha=1 / period, adjust=False).mean()
+    wilder_loss = pd.concat([pd.Series([seed_loss]), loss.iloc[period + 1:]]).ewm(alpha=1 / period, adjust=False).mean()
+    ema12, ema26 = c.ewm(span=12).mean(), c.ewm(span=26).mean()
+    macd_line = ema12 - ema26
+    signal_line = macd_line.ewm(span=9).mean()
+    middle = c.rolling(bb_period).mean()
+    std = c.rolling(bb_period).std()
+    tr = pd.concat([h - l, (h - c.shift()).abs(), (l - c.shift()).abs()], axis=1).max(axis=1)
+    return {
+        "ema": c.ewm(span=20).mean().to_numpy(),
+        "ema_noadjust": c.ewm(span=20, adjust=False).mean().to_numpy(),
+        "macd": macd_line.to_numpy(),
+        "signal": signal_line.to_numpy(),
+        "histogram": (macd_line - signal_line).to_numpy(),
+        "rsi": (100 - 100 / (1 + rs)).to_numpy(),
+        "rsi_wilder": np.concatenate([np.full(period, np.nan), (100 - 100 / (1 + wilder_gain / wilder_loss)).to_numpy()]),
+        "bb_middle": middle.to_numpy(),
+        "bb_upper": (middle + std * bb_std).to_numpy(),
+        "bb_lower": (middle - std * bb_std).to_numpy(),
+        "true_range": tr.to_numpy(),
+        "atr": tr.rolling(period).mean().to_numpy(),
+    }
+
+
+def _numpy_kernels(close, high, low, period=14, bb_period=20, bb_std=2):
+    macd_line, signal_line, hist = macd(close)
+    middle, upper, lower = bollinger(close, bb_period, bb_std)
+    return {
+        "ema": ema(close, span=20),
+        "ema_noadjust": ema(close, span=20, adjust=False),
+        "macd": macd_line,
+        "signal": signal_line,
+        "histogram": hist,
+        "rsi": rsi(close, period),
+        "rsi_wilder": rsi(close, period, method="wilder"),
+        "bb_middle": middle,
+        "bb_upper": upper,
+        "bb_lower": lower,
+        "true_range": true_range(high, low, close),
+        "atr": atr(high, low, close, period),
+    }
+
+
+def _random_bars(n_symbols, n, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 1.1 * np.exp(np.cumsum(rng.normal(0, 0.001, (n_symbols, n)), axis=-1))
+    spread = np.abs(rng.normal(0, 0.0008, (n_symbols, n)))
+    return close, close + spread, close - spread
+
+
+def validate(n=5000, tol=1e-9):
+    """Compare every kernel (1D and 2D) with the pandas reference; returns max relative errors"""
+    close, high, low = _random_bars(3, n)
+    errors = {}
+    batch = _numpy_kernels(close, high, low)
+    for row in range(close.shape[0]):
+        ref = _pandas_reference(close[row], high[row], low[row])
+        single = _numpy_kernels(close[row], high[row], low[row])
+        for name, expected in ref.items():
+            scale = np.nanmax(np.abs(expected)) or 1.0
+            for got in (single[name], batch[name][row]):
+                if not np.array_equal(np.isnan(got), np.isnan(expected)):
+                    raise AssertionError(f"{name}: NaN positions differ from pandas")
+                err = np.nanmax(np.abs(got - expected)) / scale
+                errors[name] = max(errors.get(name, 0.0), err)
+    failed = {name: err for name, err in errors.items() if err > tol}
+    if failed:
+        raise AssertionError(f"Kernels differ from pandas: {failed}")
+    return errors
+
+
+def benchmark(sizes=((1, 300), (25, 300), (5, 100000)), repeat=20):
+    """Time the full indicator set with NumPy kernels vs pandas; returns {(symbols, bars): (numpy_s, pandas_s)}"""
+    import time
+    results = {}
+    for n_symbols, n in sizes:
+        close, high, low = _random_bars(n_symbols, n)
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            _numpy_kernels(close, high, low)
+        numpy_time = (time.perf_counter() - t0) / repeat
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            for row in range(n_symbols):
+                _pandas_reference(close[row], high[row], low[row])
+        pandas_time = (time.perf_counter() - t0) / repeat
+        results[(n_symbols, n)] = (numpy_time, pandas_time)
+    return results
+
+
+if __name__ == "__main__":
+    for name, err in sorted(validate().items()):
+        print(f"{name:14s} max relative error vs pandas: {err:.2e}")
+    for (n_symbols, n), (numpy_time, pandas_time) in benchmark().items():
+        print(f"{n_symbols:3d} symbols x {n:6d} bars: numpy {numpy_time * 1e3:8.2f} ms, "
+              f"pandas {pandas_time * 1e3:8.2f} ms ({pandas_time / numpy_time:.1f}x)")
@@ -0,0 +1,221 @@
+# Shared-memory market data bus.
+#
+# One publisher (the process connected to IB) writes bars and their latest indicator
+# values into a ring buffer per (symbol, timeframe) in multiprocessing.shared_memory.
+# Any number of local reader processes attach to the same blocks by name, so IB is
+# queried once whatever the number of consumers.
+#
+# Layout of each block (8-byte words):
+#     header: [seq, count, capacity, n_fields, publisher pid]  (uint64)
+#     body:   capacity x n_fields float64 records, written round-robin
+#
+# seq is a seqlock: the writer makes it odd before touching the body and even again
+# afterwards. Readers retry when seq is odd or changed while they were copying.
+from multiprocessing import resource_tracker, shared_memory
+import os
+import time
+import numpy as np
+from config import logger, SYMBOLS, TIMEFRAMES, MARKET_BUS_NAME, MARKET_BUS_CAPACITY
+
+# Record fields: bar time as epoch seconds, OHLCV, then indicator values
+FIELDS = (
+    "time", "open", "high", "low", "close", "volume",
+    "ema_fast", "ema_slow", "histogram", "rsi", "bb_upper", "bb_middle", "bb_lower",
+)
+HEADER_WORDS = 5
+
+# Blocks created by a publisher in this process (owned, so never unregistered by readers)
+_owned = set()
+
+
+def block_name(prefix, symbol, timeframe):
+    return f"{prefix}_{symbol}_{timeframe}"
+
+
+class _Ring:
+    """Views over one shared memory block"""
+
+    def __init__(self, shm, capacity=None, create=False):
+        self.shm = shm
+        self.header = np.ndarray((HEADER_WORDS,), dtype=np.uint64, buffer=shm.buf)
+        if create:
+            self.header[:] = (0, 0, capacity, len(FIELDS), os.getpid())
+        self.capacity = int(self.header[2])
+        self.n_fields = int(self.header[3])
+        self.body = np.ndarray((self.capacity, self.n_fields), dtype=np.float64,
+                               buffer=shm.buf, offset=HEADER_WORDS * 8)
+
+
+class MarketDataPublisher:
+    """Writes bars from DataHandler into shared memory ring buffers"""
+
+    def __init__(self, prefix=MARKET_BUS_NAME, capacity=MARKET_BUS_CAPACITY, symbols=SYMBOLS, timeframes=TIMEFRAMES):
+        self.prefix = prefix
+        self.rings = {}
+        size = HEADER_WORDS * 8 + capacity * len(FIELDS) * 8
+        for sym in symbols:
+            for tf in timeframes:
+                name = block_name(prefix, sym, tf)
+                try:
+                    shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+                except FileExistsError:
+                    # Take over only blocks left by a publisher that is no longer running
+                    shm = shared_memory.SharedMemory(name=name)
+                    owner = _owner_pid(shm)
+                    if _pid_alive(owner):
+                        # Attaching registered the block with our resource tracker; don't let it unlink a live block
+                        try:
+                            resource_tracker.unregister(shm._name, "shared_memory")
+                        except Exception:
+                            pass
+                        shm.close()
+                        self.close()
+                        raise RuntimeError(f"Market data bus block {name} is in use by publisher pid {owner}")
+                    logger.warning(f"Taking over stale market data bus block {name} (publisher pid {owner} is gone)")
+                    shm.unlink()
+                    shm.close()
+                    shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+                self.rings[(sym, tf)] = _Ring(shm, capacity, create=True)
+                _owned.add(name)
+        logger.info(f"Market data bus '{prefix}' published with {len(self.rings)} ring buffers")
+
+    def publish(self, symbol, timeframe, time, values):
+        """
+        Publish the newest bar. A bar with the same time overwrites the last record.
+        Args:
+            time: Bar open time (epoch seconds or Timestamp)
+            values (dict): Bar and indicator values by field name; missing fields are NaN
+        """
+        ring = self.rings.get((symbol, timeframe))
+        if ring is None or time is None:
+            return
+        record = [pd_time_to_epoch(time)]
+        record.extend(float(values.get(f, np.nan)) for f in FIELDS[1:])
+
+        header = ring.header
+        count = int(header[1])
+        # Same bar updated (keepUpToDate): rewrite in place instead of appending
+        if count and ring.body[(count - 1) % ring.capacity, 0] == record[0]:
+            slot, new_count = (count - 1) % ring.capacity, count
+        else:
+            slot, new_count = count % ring.capacity, count + 1
+
+        header[0] += 1  # odd: write in progress
+        ring.body[slot] = record
+        header[1] = new_count
+        header[0] += 1  # even: consistent
+
+    def close(self):
+        for ring in self.rings.values():
+            _owned.discard(ring.shm.name)
+            ring.shm.close()
+            ring.shm.unlink()
+        self.rings.clear()
+
+
+def _owner_pid(shm):
+    if shm.size < HEADER_WORDS * 8:
+        return 0
+    return int(np.ndarray((HEADER_WORDS,), dtype=np.uint64, buffer=shm.buf)[4])
+
+
+def _pid_alive(pid):
+    """True if a process with this pid exists (other than us)"""
+    if not pid or pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except PermissionError:
+        return True  # exists, owned by another user
+    except (OSError, OverflowError):
+        return False
+    return True
+
+
+def pd_time_to_epoch(ts):
+    """Bar index value (Timestamp or epoch number) as epoch seconds"""
+    if hasattr(ts, "timestamp"):
+        return float(ts.timestamp())
+    return float(ts)
+
+
+class MarketDataReader:
+    """Attaches to a published ring buffer from another process"""
+
+    def __init__(self, symbol, timeframe, prefix=MARKET_BUS_NAME):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        name = block_name(prefix, symbol, timeframe)
+        shm = shared_memory.SharedMemory(name=name)
+        # Readers don't own the block; stop the resource tracker unlinking it when we exit
+        if name not in _owned:
+            try:
+                resource_tracker.unregister(shm._name, "shared_memory")
+            except Exception:
+                pass
+        self.ring = _Ring(shm)
+        self.last_count = 0
+
+    @property
+    def count(self):
+        """Total bars ever published to this ring"""
+        return int(self.ring.header[1])
+
+    def bars(self, n=None):
+        """
+        Consistent copy of the newest n records (oldest first), shape (n, len(FIELDS)).
+        Use fields() to map columns.
+        """
+        return self._read(lambda count: count if n is None else n)[1]
+
+    def _read(self, wanted):
+        """
+        Copy the newest wanted(count) records under the seqlock, so count and records
+        come from the same publish. Returns (count, records).
+        """
+        ring = self.ring
+        while True:
+            seq = int(ring.header[0])
+            if seq & 1:
+                continue
+            count = int(ring.header[1])
+            n_read = max(0, min(wanted(count), count, ring.capacity))
+            idx = np.arange(count - n_read, count) % ring.capacity
+            out = ring.body[idx]  # fancy indexing copies
+            if int(ring.header[0]) == seq:
+                return count, out
+
+    def latest(self):
+        """Newest record as a dict, or None"""
+        bars = self.bars(1)
+        if not len(bars):
+            return None
+        return dict(zip(FIELDS, bars[0].tolist()))
+
+    def view(self):
+        """Zero-copy view of the raw ring body (may be torn while the publisher writes)"""
+        return self.ring.body
+
+    def poll(self):
+        """New records since the last poll/wait call (oldest first)"""
+        last = self.last_count
+        # A count below the last one means the publisher restarted: everything is new
+        count, out = self._read(lambda count: count - last if count >= last else count)
+        self.last_count = count
+        return out
+
+    def wait(self, timeout=None, interval=0.001):
+        """Block until a new bar is published (or timeout), then return the new records"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.count == self.last_count:
+            if deadline is not None and time.monotonic() >= deadline:
+                return self.bars(0)
+            time.sleep(interval)
+        return self.poll()
+
+    @staticmethod
+    def fields():
+        return FIELDS
+
+    def close(self):
+        self.ring.shm.close()
@@ -0,0 +1,267 @@
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+import time
+from config import logger, SYMBOLS, METRICS_HOST, METRICS_PORT, METRICS_RATE_WINDOW
+from recorder import WRAPPER_METHODS
+
+BAR_CALLBACKS = frozenset(["historicalData", "historicalDataUpdate"])
+TICK_CALLBACKS = frozenset(["tickPrice", "tickSize", "tickString", "tickGeneric"])
+TERMINAL_STATUSES = frozenset(["Filled", "Cancelled", "ApiCancelled", "Inactive"])
+
+
+class RateMeter:
+    """Per-key event rates over a sliding window of one-second buckets"""
+
+    def __init__(self, window=METRICS_RATE_WINDOW):
+        self.window = window
+        self.lock = Lock()
+        self.buckets = {}  # key -> deque of [second, amount]
+        self.totals = {}
+
+    def mark(self, key, amount=1.0):
+        now = int(time.monotonic())
+        with self.lock:
+            buckets = self.buckets.get(key)
+            if buckets is None:
+                buckets = self.buckets[key] = deque()
+            if buckets and buckets[-1][0] == now:
+                buckets[-1][1] += amount
+            else:
+                buckets.append([now, amount])
+            while buckets[0][0] <= now - self.window:
+                buckets.popleft()
+            self.totals[key] = self.totals.get(key, 0.0) + amount
+
+    def rate(self, key):
+        """Amount per second over the last window"""
+        cutoff = int(time.monotonic()) - self.window
+        with self.lock:
+            return sum(amount for second, amount in self.buckets.get(key, ()) if second > cutoff) / self.window
+
+    def total(self, key):
+        with self.lock:
+            return self.totals.get(key, 0.0)
+
+    def keys(self):
+        with self.lock:
+            return list(self.totals)
+
+
+class MetricsWrapper:
+    """Stands in for the EWrapper given to EClient; counts and times each callback"""
+
+    def __init__(self, target, metrics):
+        self._target = target
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        if name not in WRAPPER_METHODS:
+            return getattr(self._target, name)
+        target = self._target
+        metrics = self._metrics
+
+        def measured(*args):
+            start = time.perf_counter()
+            try:
+                return getattr(target, name)(*args)
+            finally:
+                metrics.on_callback(name, args, time.perf_counter() - start)
+
+        # Cache so later lookups skip __getattr__
+        self.__dict__[name] = measured
+        return measured
+
+
+class Metrics:
+    """Runtime health metrics, served in Prometheus text format"""
+
+    def __init__(self, app):
+        self.app = app
+        self.rates = RateMeter()
+        self.lock = Lock()
+        self.started = time.monotonic()
+        self.cycles = {"count": 0, "sum": 0.0, "max": 0.0, "last": 0.0}
+        self.orders = {}  # orderId -> [sent at, last status]
+        self.order_counts = {"submitted": 0, "acknowledged": 0}
+        self.order_status_counts = {}
+        self.order_ack_seconds = 0.0
+        self.server = None
+
+    def wrap(self, target):
+        """Return a wrapper proxy that feeds callback counts and timings into these metrics"""
+        return MetricsWrapper(target, self)
+
+    # --- Collection ---
+
+    def on_callback(self, name, args, elapsed):
+        self.rates.mark(("busy",), elapsed)
+        try:
+            if name in BAR_CALLBACKS:
+                # Live streams only; downloader request ids are outside the symbol range
+                if args[0] < len(SYMBOLS) * 100:
+                    self.rates.mark(("bars", SYMBOLS[args[0] // 100]))
+            elif name in TICK_CALLBACKS:
+                sub = self.app.realtime_data.active_subscriptions.get(args[0])
+                if sub is not None:
+                    self.rates.mark(("ticks", sub["symbol"]))
+            elif name == "orderStatus":
+                self.on_order_status(args[0], args[1])
+        except Exception as e:
+            logger.error(f"Error collecting metrics for {name}: {str(e)}")
+
+    def on_order_sent(self, orderId):
+        with self.lock:
+            self.orders[orderId] = [time.monotonic(), None]
+            self.order_counts["submitted"] += 1
+
+    def on_order_status(self, orderId, status):
+        with self.lock:
+            order = self.orders.get(orderId)
+            # IB repeats statuses; count each transition once
+            if order is None or order[1] == status:
+                return
+            if order[1] is None:
+                self.order_counts["acknowledged"] += 1
+                self.order_ack_seconds += time.monotonic() - order[0]
+            order[1] = status
+            self.order_status_counts[status] = self.order_status_counts.get(status, 0) + 1
+            if status in TERMINAL_STATUSES:
+                del self.orders[orderId]
+
+    def observe_cycle(self, seconds):
+        with self.lock:
+            self.cycles["count"] += 1
+            self.cycles["sum"] += seconds
+            self.cycles["last"] = seconds
+            self.cycles["max"] = max(self.cycles["max"], seconds)
+
+    # --- Exposition ---
+
+    def render(self):
+        """Current metrics in Prometheus text exposition format"""
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+                lines.append(f"{name}{{{label_text}}} {float(value)}" if label_text else f"{name} {float(value)}")
+
+        keys = self.rates.keys()
+        bars = [k[1] for k in keys if k[0] == "bars"]
+        ticks = [k[1] for k in keys if k[0] == "ticks"]
+        metric("ibbot_bars_per_second", "gauge", f"Bars ingested per second over the last {self.rates.window}s",
+               [((("symbol", s),), self.rates.rate(("bars", s))) for s in bars])
+        metric("ibbot_bars_total", "counter", "Bars ingested",
+               [((("symbol", s),), self.rates.total(("bars", s))) for s in bars])
+        metric("ibbot_ticks_per_second", "gauge", f"Market data ticks per second over the last {self.rates.window}s",
+               [((("symbol", s),), self.rates.rate(("ticks", s))) for s in ticks])
+        metric("ibbot_ticks_total", "counter", "Market data ticks received",
+               [((("symbol", s),), self.rates.total(("ticks", s))) for s in ticks])
+
+        # Busy seconds per second of wall time; near 1.0 means the reader thread is saturated
+        window = min(self.rates.window, max(time.monotonic() - self.started, 1.0))
+        busy_rate = self.rates.rate(("busy",)) * self.rates.window / window
+        metric("ibbot_callback_busy_ratio", "gauge", "Fraction of time the IB reader thread spends in callbacks",
+               [((), min(busy_rate, 1.0))])
+        metric("ibbot_callback_busy_seconds_total", "counter", "Time spent in IB callbacks",
+               [((), self.rates.total(("busy",)))])
+
+        with self.lock:
+            cycles = dict(self.cycles)
+            order_counts = dict(self.order_counts)
+            status_counts = dict(self.order_status_counts)
+            ack_seconds = self.order_ack_seconds
+            in_flight = len(self.orders)
+        lines.append("# HELP ibbot_strategy_cycle_seconds Duration of strategy signal/risk/order cycles")
+        lines.append("# TYPE ibbot_strategy_cycle_seconds summary")
+        lines.append(f"ibbot_strategy_cycle_seconds_count {float(cycles['count'])}")
+        lines.append(f"ibbot_strategy_cycle_seconds_sum {float(cycles['sum'])}")
+        metric("ibbot_strategy_cycle_last_seconds", "gauge", "Duration of the last strategy cycle", [((), cycles["last"])])
+        metric("ibbot_strategy_cycle_max_seconds", "gauge", "Longest strategy cycle", [((), cycles["max"])])
+
+        metric("ibbot_orders_total", "counter", "Orders submitted and acknowledged by IB",
+               [((("stage", stage),), count) for stage, count in order_counts.items()])
+        metric("ibbot_order_status_total", "counter", "Order status transitions reported by IB",
+               [((("status", status),), count) for status, count in sorted(status_counts.items())])
+        metric("ibbot_order_ack_seconds_total", "counter", "Summed submit-to-first-status latency", [((), ack_seconds)])
+        metric("ibbot_orders_in_flight", "gauge", "Orders submitted and not yet in a terminal status", [((), in_flight)])
+
+        scheduler = self.app.scheduler
+        metric("ibbot_pacing_tokens_remaining", "gauge", "Request tokens available per pacing class",
+               [((("class", name),), tokens) for name, tokens in sorted(scheduler.tokens_remaining().items())])
+        metric("ibbot_pacing_queue_depth", "gauge", "Requests waiting per pacing class",
+               [((("class", name),), depth) for name, depth in sorted(scheduler.queue_depth().items())])
+
+        metric("ibbot_frame_bytes", "gauge", "Bytes held per DataHandler frame",
+               [((("symbol", sym), ("timeframe", tf)), size)
+                for (sym, tf), size in sorted(self.app.data_handler.frame_bytes().items())])
+        report = self.app.data_handler.memory_report()
+        metric("ibbot_instrument_bytes", "gauge", "Bytes held per instrument across timeframes",
+               [((("symbol", sym),), entry["bytes"]) for sym, entry in sorted(report.items())])
+        metric("ibbot_instrument_bars", "gauge", "Bars held in memory per instrument across timeframes",
+               [((("symbol", sym),), entry["bars"]) for sym, entry in sorted(report.items())])
+        return "\n".join(lines) + "\n"
+
+    def serve(self, host=METRICS_HOST, port=METRICS_PORT):
+        """Serve GET /metrics on a background thread. Returns the bound port, or None if it could not bind."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                try:
+                    body = metrics.render().encode()
+                except Exception as e:
+                    logger.error(f"Error rendering metrics: {str(e)}")
+                    self.send_error(500)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # scrapes every few seconds would flood the bot log
+
+        try:
+            self.server = ThreadingHTTPServer((host, port), Handler)
+        except OSError as e:
+            # e.g. port in use by another bot instance; run without the endpoint
+            logger.error(f"Error starting metrics server on {host}:{port}: {str(e)}")
+            return None
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        logger.info(f"Metrics served at http://{host}:{self.server.server_address[1]}/metrics")
+        return self.server.server_address[1]
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+def parse_metrics(text):
+    """
+    Parse Prometheus text format into {(name, ((label, value), ...)): float}.
+    Enough for a stand-in scraper to check the values served by Metrics.
+    """
+    samples = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        series, value = line.rsplit(" ", 1)
+        labels = ()
+        if "{" in series:
+            series, label_text = series[:-1].split("{", 1)
+            labels = tuple(
+                (k, v.strip('"')) for k, v in (pair.split("=", 1) for pair in label_text.split(",") if pair)
+            )
+        samples[(series, labels)] = float(value)
+    return samples
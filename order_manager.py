@@ -1,66 +1,58 @@
-import pandas as pd
-from ibapi.contract import Contract
+from threading import Lock
+import indicators
 from ibapi.order import Order
+from ibapi.execution import ExecutionFilter
 from config import (
     logger, RISK_PER_TRADE, TRAILING_STOP_START, 
     TRAILING_STOP_STEP, INITIAL_LEVERAGE
 )
 
+# Request ID reserved for execution reconciliation
+EXECUTIONS_REQ_ID = 9003
+
 class OrderManager:
     def __init__(self, client):
         self.client = client
         self.open_orders = 0
         self.positions = {}  # Track positions by symbol
         self.order_ids = {}  # Track order IDs by symbol
+        self.filled = {}     # orderId -> cumulative filled quantity seen in executions
+        self.id_lock = Lock()  # order ids are taken by strategy cycles and AsyncClient alike
     
-    def place_order(self, sym, direction, price):
-        """Place an order with stop loss and take profit"""
+    def place_order(self, sym, direction, price, qty=None, tag=None):
+        """
+        Place an order with stop loss and take profit.
+        Args:
+            tag (str): Strategy slot names sent as orderRef on all three orders
+        Returns:
+            Parent order ID, or None if nothing was placed
+        """
         try:
             # Check if we already have a position for this symbol
             if sym in self.positions and self.positions[sym]:
                 logger.info(f"Already have a position for {sym}, skipping")
-                return
+                return None
                 
-            # Position sizing: Risk 2% of account
-            sl_pips = self._calculate_stop_loss_pips(sym)
-            tp_pips = sl_pips * 2  # 2:1 reward-to-risk ratio
-            
-            # Calculate stop loss distance based on currency pair
-            is_jpy_pair = "JPY" in sym
-            pip_multiplier = 0.01 if is_jpy_pair else 0.0001
-            sl_dist = sl_pips * pip_multiplier
-            tp_dist = tp_pips * pip_multiplier
-            
-            # Get account value for position sizing
-            if self.client.accountValue[0] is None or self.client.accountValue[1] is None:
-                logger.warning("Account value not available, using default position size")
-                account_value = 1000  # Default account value
-            else:
-                account_value = float(self.client.accountValue[1])
-            
-            # Calculate risk amount
-            risk_amount = account_value * RISK_PER_TRADE
-            
-            # Leverage increase on profit
-            profit_threshold = getattr(self.client, "profit_threshold", 0.05)
-            leverage = INITIAL_LEVERAGE
-            if hasattr(self.client, "starting_equity") and account_value > self.client.starting_equity * (1 + profit_threshold):
-                leverage = int(INITIAL_LEVERAGE * 1.5)  # Increase leverage by 50% when profitable
-            
-            symbol_multiplier = 100 if is_jpy_pair else 10000
-            qty = max(1, int((risk_amount * leverage) / (sl_dist * symbol_multiplier)))
+            # Position sizing: Risk 2% of account (quantity may be pre-sized by the risk engine)
+            sized_qty, sl_dist, tp_dist = self.calculate_position_size(sym)
+            if qty is None:
+                qty = sized_qty
             
             # Create contract
             contract = self._create_contract(sym)
             
             # Create orders
             main_order, parent_id = self._create_main_order(direction, qty)
-            sl_order = self._create_stop_loss_order(direction, qty, price, sl_dist, parent_id)
-            tp_order = self._create_take_profit_order(direction, qty, price, tp_dist, parent_id)
+            sl_order = self._create_stop_loss_order(sym, direction, qty, price, sl_dist, parent_id)
+            tp_order = self._create_take_profit_order(sym, direction, qty, price, tp_dist, parent_id)
+            
+            if tag:
+                for order in (main_order, sl_order, tp_order):
+                    order.orderRef = tag
             
             # Calculate SL and TP prices
-            sl_price = price - sl_dist if direction == "BUY" else price + sl_dist
-            tp_price = price + tp_dist if direction == "BUY" else price - tp_dist
+            sl_price = sl_order.auxPrice
+            tp_price = tp_order.lmtPrice
             
             # Place orders
             self.client.placeOrder(parent_id, contract, main_order)
@@ -77,7 +69,8 @@ class OrderManager:
                 "parent_id": parent_id,
                 "sl_order_id": sl_order.orderId,
                 "tp_order_id": tp_order.orderId,
-                "trailing_active": False
+                "trailing_active": False,
+                "tag": tag
             }
             
             # Track order IDs
@@ -87,9 +80,42 @@ class OrderManager:
             
             logger.info(f"{direction} {sym} QTY={qty} @ {price:.5f}, SL={sl_price:.5f}, TP={tp_price:.5f}")
             self.open_orders += 1
+            return parent_id
             
         except Exception as e:
             logger.error(f"Error placing order: {str(e)}")
+            return None
+    
+    def calculate_position_size(self, sym):
+        """Return (quantity, stop loss distance, take profit distance) for a new position"""
+        sl_pips = self._calculate_stop_loss_pips(sym)
+        tp_pips = sl_pips * 2  # 2:1 reward-to-risk ratio
+        
+        # Calculate stop loss distance based on currency pair
+        is_jpy_pair = "JPY" in sym
+        pip_multiplier = 0.01 if is_jpy_pair else 0.0001
+        sl_dist = sl_pips * pip_multiplier
+        tp_dist = tp_pips * pip_multiplier
+        
+        # Get account value for position sizing (cached, streamed by AccountState)
+        account_value = self.client.account_state.net_liquidation()
+        if account_value is None:
+            logger.warning("Account value not available, using default position size")
+            account_value = 1000  # Default account value
+        
+        # Calculate risk amount
+        risk_amount = account_value * RISK_PER_TRADE
+        
+        # Leverage increase on profit
+        profit_threshold = getattr(self.client, "profit_threshold", 0.05)
+        leverage = INITIAL_LEVERAGE
+        if hasattr(self.client, "starting_equity") and account_value > self.client.starting_equity * (1 + profit_threshold):
+            leverage = int(INITIAL_LEVERAGE * 1.5)  # Increase leverage by 50% when profitable
+        
+        symbol_multiplier = 100 if is_jpy_pair else 10000
+        qty = max(1, int((risk_amount * leverage) / (sl_dist * symbol_multiplier)))
+        qty = self.client.contracts.round_quantity(sym, qty)
+        return qty, sl_dist, tp_dist
     
     def _calculate_stop_loss_pips(self, symbol):
         """Calculate dynamic stop loss based on volatility"""
@@ -100,16 +126,7 @@ class OrderManager:
                 return 10  # Default if not enough data
                 
             # Calculate Average True Range (ATR)
-            high = df['high'].astype(float)
-            low = df['low'].astype(float)
-            close = df['close'].astype(float)
-            
-            tr1 = high - low
-            tr2 = abs(high - close.shift())
-            tr3 = abs(low - close.shift())
-            
-            tr = pd.concat([tr1, tr2, tr3], axis=1).max(axis=1)
-            atr = tr.rolling(14).mean().iloc[-1]
+            atr = indicators.atr(df['high'], df['low'], df['close'], 14)[-1]
             
             # Convert ATR to pips
             is_jpy_pair = "JPY" in symbol
@@ -124,14 +141,22 @@ class OrderManager:
             logger.error(f"Error calculating stop loss: {str(e)}")
             return 10  # Default value
     
+    def next_order_id(self):
+        """Allocate the next order ID (the only place client.nextOrderId is advanced)"""
+        with self.id_lock:
+            order_id = self.client.nextOrderId
+            self.client.nextOrderId += 1
+            return order_id
+    
+    def on_next_valid_id(self, orderId):
+        """Adopt the next valid ID from IB, never going back to one already handed out"""
+        with self.id_lock:
+            if self.client.nextOrderId is None or orderId > self.client.nextOrderId:
+                self.client.nextOrderId = orderId
+    
     def _create_contract(self, sym):
-        """Create a contract for the given symbol"""
-        contract = Contract()
-        contract.symbol = sym[:3]
-        contract.secType = "CASH"
-        contract.currency = sym[3:]
-        contract.exchange = "IDEALPRO"
-        return contract
+        """Get the resolved contract for the given symbol"""
+        return self.client.contracts.get(sym)
     
     def _create_main_order(self, direction, qty):
         """Create the main order"""
@@ -140,12 +165,11 @@ class OrderManager:
         main_order.totalQuantity = qty
         main_order.action = direction
         main_order.transmit = False  # Don't transmit until we've attached SL/TP
-        main_order.orderId = self.client.nextOrderId
-        parent_id = self.client.nextOrderId
-        self.client.nextOrderId += 1
+        main_order.orderId = self.next_order_id()
+        parent_id = main_order.orderId
         return main_order, parent_id
     
-    def _create_stop_loss_order(self, direction, qty, price, sl_dist, parent_id):
+    def _create_stop_loss_order(self, sym, direction, qty, price, sl_dist, parent_id):
         """Create a stop loss order"""
         sl_price = price - sl_dist if direction == "BUY" else price + sl_dist
         
@@ -153,15 +177,14 @@ class OrderManager:
         sl_order.orderType = "STP"
         sl_order.totalQuantity = qty
         sl_order.action = "SELL" if direction == "BUY" else "BUY"
-        sl_order.auxPrice = round(sl_price, 5)
+        sl_order.auxPrice = self.client.contracts.round_price(sym, sl_price)
         sl_order.parentId = parent_id
         sl_order.transmit = False
-        sl_order.orderId = self.client.nextOrderId
-        self.client.nextOrderId += 1
+        sl_order.orderId = self.next_order_id()
         
         return sl_order
     
-    def _create_take_profit_order(self, direction, qty, price, tp_dist, parent_id):
+    def _create_take_profit_order(self, sym, direction, qty, price, tp_dist, parent_id):
         """Create a take profit order"""
         tp_price = price + tp_dist if direction == "BUY" else price - tp_dist
         
@@ -169,11 +192,10 @@ class OrderManager:
         tp_order.orderType = "LMT"
         tp_order.totalQuantity = qty
         tp_order.action = "SELL" if direction == "BUY" else "BUY"
-        tp_order.lmtPrice = round(tp_price, 5)
+        tp_order.lmtPrice = self.client.contracts.round_price(sym, tp_price)
         tp_order.parentId = parent_id
         tp_order.transmit = True  # This will transmit all orders
-        tp_order.orderId = self.client.nextOrderId
-        self.client.nextOrderId += 1
+        tp_order.orderId = self.next_order_id()
         
         return tp_order
     
@@ -198,17 +220,11 @@ class OrderManager:
                     # Check if this is a SL or TP order
                     if orderId == self.positions[sym]["sl_order_id"]:
                         logger.info(f"Stop loss for {sym} triggered")
-                        self.positions[sym] = None
-                        self.open_orders -= 1
-                        # Notify strategy that position is closed
-                        self.client.strategy.update_position(sym, "closed")
+                        self._close_position(sym)
                         
                     elif orderId == self.positions[sym]["tp_order_id"]:
                         logger.info(f"Take profit for {sym} reached")
-                        self.positions[sym] = None
-                        self.open_orders -= 1
-                        # Notify strategy that position is closed
-                        self.client.strategy.update_position(sym, "closed")
+                        self._close_position(sym)
             
             # Handle cancelled orders
             elif status == "Cancelled":
@@ -218,14 +234,48 @@ class OrderManager:
                     orderId == self.positions[sym]["tp_order_id"]
                 ):
                     logger.info(f"Order for {sym} cancelled")
-                    self.positions[sym] = None
-                    self.open_orders -= 1
-                    # Notify strategy that position is closed
-                    self.client.strategy.update_position(sym, "closed")
+                    self._close_position(sym)
                     
         except Exception as e:
             logger.error(f"Error updating order status: {str(e)}")
     
+    def _close_position(self, sym):
+        """Forget a closed position and notify the strategies that opened it"""
+        tag = self.positions[sym].get("tag")
+        self.positions[sym] = None
+        self.open_orders -= 1
+        self.client.strategies.on_position_closed(sym, tag)
+    
+    def reconcile(self):
+        """Ask IB for open orders and today's executions to resync after a reconnect"""
+        self.client.reqOpenOrders()
+        self.client.reqExecutions(EXECUTIONS_REQ_ID, ExecutionFilter())
+        logger.info("Reconciling open orders and executions")
+    
+    def reconcile_open_order(self, orderId, contract, order):
+        """Track an open order reported by IB that we have no record of"""
+        if orderId in self.order_ids:
+            return
+        sym = f"{contract.symbol}{contract.currency}"
+        self.order_ids[orderId] = sym
+        logger.info(f"Reconciled open order {orderId} for {sym} ({order.action} {order.totalQuantity} {order.orderType})")
+    
+    def reconcile_execution(self, contract, execution):
+        """Apply a fill that may have happened while disconnected"""
+        sym = self._get_symbol_for_order(execution.orderId, 0)
+        pos = self.positions.get(sym) if sym else None
+        if not pos:
+            return
+        # execDetails arrives per partial fill; cumQty is the order's running total
+        filled = max(float(execution.cumQty), self.filled.get(execution.orderId, 0.0))
+        self.filled[execution.orderId] = filled
+        remaining = float(pos["quantity"]) - filled
+        if remaining > 0:
+            logger.info(f"Order {execution.orderId} for {sym} partially filled: {filled} of {pos['quantity']}")
+            return
+        parent_id = 0 if execution.orderId == pos["parent_id"] else pos["parent_id"]
+        self.update_order_status(execution.orderId, "Filled", filled, 0, execution.avgPrice, parent_id)
+    
     def _get_symbol_for_order(self, orderId, parentId):
         """Find which symbol an order belongs to"""
         # First check direct mapping
@@ -295,10 +345,10 @@ class OrderManager:
     def _get_current_price(self, symbol):
         """Get current price for a symbol"""
         try:
-            df = self.client.data_handler.get_data(symbol, "M1")
-            if df.empty:
+            snap = self.client.data_handler.get_snapshot(symbol, "M1")
+            if snap is None:
                 return None
-            return df["close"].iloc[-1]
+            return snap.close
         except Exception as e:
             logger.error(f"Error getting current price: {str(e)}")
             return None
@@ -316,10 +366,12 @@ class OrderManager:
             sl_order.orderType = "STP"
             sl_order.totalQuantity = position["quantity"]
             sl_order.action = "SELL" if position["direction"] == "BUY" else "BUY"
-            sl_order.auxPrice = round(new_sl_price, 5)
+            sl_order.auxPrice = self.client.contracts.round_price(symbol, new_sl_price)
             sl_order.parentId = position["parent_id"]
             sl_order.transmit = True
-            sl_order.orderId = self.client.nextOrderId
+            sl_order.orderId = self.next_order_id()
+            if position.get("tag"):
+                sl_order.orderRef = position["tag"]
             
             # Update tracking
             old_sl_id = position["sl_order_id"]
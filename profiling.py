@@ -0,0 +1,214 @@
+from collections import Counter
+from threading import Lock, Thread
+import functools
+import os
+import signal
+import sys
+import threading
+import time
+from config import (
+    logger, PROFILE_CONTROL_FILE, PROFILE_OUTPUT_DIR, PROFILE_SAMPLE_SECONDS, PROFILE_SAMPLE_INTERVAL
+)
+
+
+class Profiler:
+    """
+    Runtime-switchable profiling for live callbacks and strategy cycles.
+
+    Counters wrap the registered methods with timing shims only while enabled; when
+    off the original methods are restored, so there is no overhead at all. Control it
+    with SIGUSR1 (toggle counters), SIGUSR2 (sampling capture) or by writing a command
+    to PROFILE_CONTROL_FILE: "on", "off", "dump" or "sample [seconds]". Both are acted
+    on by one watcher thread, which runs until the `stop` event is set.
+    """
+
+    def __init__(self, stop=None):
+        self.targets = []   # (object, label, method names)
+        self.stats = {}     # "Label.method" -> [calls, total seconds, max seconds]
+        self.lock = Lock()
+        self.enabled = False
+        self.sampling = False
+        self.stop = stop or threading.Event()
+        self.control_file = None
+        self.signalled = []  # commands requested by signal handlers, run by the watcher
+        self.watcher = None
+
+    def register(self, obj, methods, label=None):
+        """Add methods of an object to instrument while profiling is on"""
+        self.targets.append((obj, label or type(obj).__name__, list(methods)))
+        if self.enabled:
+            self._instrument(obj, label or type(obj).__name__, methods)
+
+    # --- Call counters ---
+
+    def enable(self):
+        if self.enabled:
+            return
+        self.enabled = True
+        for obj, label, methods in self.targets:
+            self._instrument(obj, label, methods)
+        logger.info("Profiling counters enabled")
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        for obj, _, methods in self.targets:
+            for name in methods:
+                # Drop the instance shim so the class method is found again
+                obj.__dict__.pop(name, None)
+        self.dump()
+        logger.info("Profiling counters disabled")
+
+    def toggle(self):
+        self.disable() if self.enabled else self.enable()
+
+    def reset(self):
+        with self.lock:
+            # Cleared in place: active shims hold a reference to this dict
+            self.stats.clear()
+
+    def _instrument(self, obj, label, methods):
+        for name in methods:
+            method = getattr(type(obj), name, None)
+            if not callable(method) or name in obj.__dict__:
+                continue
+            setattr(obj, name, self._timed(f"{label}.{name}", method.__get__(obj)))
+
+    def _timed(self, key, fn):
+        stats, lock = self.stats, self.lock
+
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                with lock:
+                    entry = stats.get(key)
+                    if entry is None:
+                        stats[key] = [1, elapsed, elapsed]
+                    else:
+                        entry[0] += 1
+                        entry[1] += elapsed
+                        if elapsed > entry[2]:
+                            entry[2] = elapsed
+        return timed
+
+    def report(self):
+        """Counter table sorted by cumulative time"""
+        with self.lock:
+            rows = sorted(self.stats.items(), key=lambda kv: -kv[1][1])
+        lines = [f"{'method':50s} {'calls':>10s} {'total s':>10s} {'mean ms':>10s} {'max ms':>10s}"]
+        for key, (calls, total, worst) in rows:
+            lines.append(f"{key:50s} {calls:10d} {total:10.3f} {total / calls * 1e3:10.3f} {worst * 1e3:10.3f}")
+        return "\n".join(lines)
+
+    def dump(self):
+        """Write the counter table to PROFILE_OUTPUT_DIR and the log"""
+        if not self.stats:
+            return None
+        os.makedirs(PROFILE_OUTPUT_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_OUTPUT_DIR, f"profile_stats_{time.strftime('%Y%m%d_%H%M%S')}.txt")
+        report = self.report()
+        with open(path, "w") as f:
+            f.write(report + "\n")
+        logger.info(f"Profile counters written to {path}\n{report}")
+        return path
+
+    # --- Sampling profiler ---
+
+    def sample(self, seconds=PROFILE_SAMPLE_SECONDS, interval=PROFILE_SAMPLE_INTERVAL, background=True):
+        """Sample all thread stacks for a while and write them in folded (flamegraph.pl) format"""
+        if self.sampling:
+            logger.info("Sampling capture already running")
+            return None
+        if background:
+            Thread(target=self.sample, args=(seconds, interval, False), daemon=True).start()
+            return None
+        self.sampling = True
+        try:
+            counts = Counter()
+            me = threading.get_ident()
+            deadline = time.monotonic() + seconds
+            logger.info(f"Sampling thread stacks for {seconds}s")
+            while time.monotonic() < deadline:
+                names = {t.ident: t.name for t in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                        frame = frame.f_back
+                    stack.append(names.get(ident, str(ident)))
+                    counts[";".join(reversed(stack))] += 1
+                time.sleep(interval)
+
+            os.makedirs(PROFILE_OUTPUT_DIR, exist_ok=True)
+            path = os.path.join(PROFILE_OUTPUT_DIR, f"profile_stacks_{time.strftime('%Y%m%d_%H%M%S')}.folded")
+            with open(path, "w") as f:
+                for stack, count in counts.most_common():
+                    f.write(f"{stack} {count}\n")
+            logger.info(f"Wrote {sum(counts.values())} stack samples to {path}")
+            return path
+        finally:
+            self.sampling = False
+
+    # --- Runtime control ---
+
+    def install_signal_handlers(self):
+        """SIGUSR1 toggles counters, SIGUSR2 starts a sampling capture (main thread only, POSIX)"""
+        if not hasattr(signal, "SIGUSR1"):
+            return
+        # Handlers only queue the command: taking locks, logging or writing files in signal
+        # context deadlocks if the interrupted code holds the same lock
+        signal.signal(signal.SIGUSR1, lambda signum, frame: self.signalled.append(["toggle"]))
+        signal.signal(signal.SIGUSR2, lambda signum, frame: self.signalled.append(["sample"]))
+        self._start_watcher()
+
+    def watch_control_file(self, path=PROFILE_CONTROL_FILE):
+        """Poll a control file for commands; each command is consumed by deleting the file"""
+        self.control_file = path
+        self._start_watcher()
+
+    def _start_watcher(self, poll=1.0):
+        if self.watcher is None:
+            self.watcher = Thread(target=self._watch, args=(poll,), daemon=True, name="profiler")
+            self.watcher.start()
+
+    def _watch(self, poll):
+        while not self.stop.wait(poll):
+            try:
+                while self.signalled:
+                    self.handle_command(self.signalled.pop(0))
+                path = self.control_file
+                if path is None or not os.path.exists(path):
+                    continue
+                with open(path) as f:
+                    command = f.read().split()
+                os.remove(path)
+                self.handle_command(command)
+            except Exception as e:
+                logger.error(f"Error handling profiler command: {str(e)}")
+
+    def handle_command(self, command):
+        if not command:
+            return
+        action = command[0].lower()
+        if action == "on":
+            self.enable()
+        elif action == "off":
+            self.disable()
+        elif action == "toggle":
+            self.toggle()
+        elif action == "dump":
+            self.dump()
+        elif action == "reset":
+            self.reset()
+        elif action == "sample":
+            self.sample(float(command[1]) if len(command) > 1 else PROFILE_SAMPLE_SECONDS)
+        else:
+            logger.warning(f"Unknown profiler command: {' '.join(command)}")
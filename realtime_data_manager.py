@@ -1,5 +1,4 @@
 from ibapi.ticktype import TickTypeEnum
-from ibapi.contract import Contract
 from config import logger
 
 class RealTimeDataManager:
@@ -10,17 +9,21 @@ class RealTimeDataManager:
 
     def subscribe_to_pair(self, symbol, timeframe='M1'):
         """Subscribe to real-time data for a forex pair"""
-        contract = self._create_forex_contract(symbol)
         req_id = self._generate_subscription_id(symbol, timeframe)
         
-        self.connection.reqMktData(
-            reqId=req_id,
-            contract=contract,
-            genericTickList="",
-            snapshot=False,
-            regulatorySnapshot=False,
-            mktDataOptions=[]
-        )
+        def send():
+            self.connection.reqMktData(
+                reqId=req_id,
+                contract=self._create_forex_contract(symbol),
+                genericTickList="",
+                snapshot=False,
+                regulatorySnapshot=False,
+                mktDataOptions=[]
+            )
+        
+        # Each subscription holds a market data line until it is cancelled
+        if not self.connection.scheduler.submit("market_data", ("market_data", req_id), send):
+            return
         
         self.active_subscriptions[req_id] = {
             'symbol': symbol,
@@ -29,6 +32,34 @@ class RealTimeDataManager:
         }
         logger.info(f"Subscribed to real-time data for {symbol}")
 
+    def unsubscribe_from_pair(self, symbol, timeframe='M1'):
+        """Cancel real-time data for a forex pair and free its market data line"""
+        req_id = self._generate_subscription_id(symbol, timeframe)
+        if self.active_subscriptions.pop(req_id, None) is None:
+            return
+        self.connection.cancelMktData(req_id)
+        self.connection.scheduler.complete(("market_data", req_id), release=True)
+        logger.info(f"Unsubscribed from real-time data for {symbol}")
+
+    def cancel_streams(self):
+        """Cancel market data at IB, keeping the subscriptions (and their lines) for resubscribe()"""
+        for req_id in list(self.active_subscriptions):
+            self.connection.cancelMktData(req_id)
+
+    def resubscribe(self):
+        """Re-issue all market data subscriptions after a reconnect"""
+        for req_id, sub_info in list(self.active_subscriptions.items()):
+            self.connection.reqMktData(
+                reqId=req_id,
+                contract=self._create_forex_contract(sub_info['symbol']),
+                genericTickList="",
+                snapshot=False,
+                regulatorySnapshot=False,
+                mktDataOptions=[]
+            )
+        if self.active_subscriptions:
+            logger.info(f"Resubscribed to real-time data for {len(self.active_subscriptions)} pairs")
+
     def process_tick(self, req_id, tick_type, value):
         """Process incoming tick data"""
         if req_id not in self.active_subscriptions:
@@ -42,12 +73,7 @@ class RealTimeDataManager:
             self.data_handler.update_realtime_price(symbol, timeframe, value)
 
     def _create_forex_contract(self, symbol):
-        contract = Contract()
-        contract.symbol = symbol[:3]
-        contract.secType = "CASH"
-        contract.currency = symbol[3:]
-        contract.exchange = "IDEALPRO"
-        return contract
+        return self.connection.contracts.get(symbol)
 
     def _generate_subscription_id(self, symbol, timeframe):
         return hash(f"{symbol}_{timeframe}") % 1000000
\ No newline at end of file
@@ -0,0 +1,193 @@
+from threading import Lock
+import os
+import pickle
+import struct
+import time
+from ibapi.wrapper import EWrapper
+from config import logger
+
+# Event log format: MAGIC, then records of
+#     <float64 timestamp><uint16 method id><uint32 payload length><payload>
+# Method id 0 defines the next id: its payload is the method name. Other payloads are
+# the pickled positional arguments of the wrapper call.
+MAGIC = b"IBEVLOG1"
+RECORD = struct.Struct("<dHI")
+DEFINE = 0
+FLUSH_EVERY = 256
+
+# Inbound callbacks: every public EWrapper method
+WRAPPER_METHODS = frozenset(
+    name for name in dir(EWrapper)
+    if not name.startswith("_") and name != "logAnswer" and callable(getattr(EWrapper, name))
+)
+
+
+class EventRecorder:
+    """Appends every inbound wrapper call to a compact binary event log"""
+
+    def __init__(self, path):
+        self.path = path
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, "ab")
+        self.lock = Lock()
+        self.ids = {}
+        self.pending = 0
+        if new_file:
+            self.file.write(MAGIC)
+        else:
+            # Method ids are per recording session; continue numbering after existing definitions
+            self.ids = {name: i for i, name in enumerate(_read_names(path), start=1)}
+        logger.info(f"Recording IB callbacks to {path}")
+
+    def wrap(self, target):
+        """Return a wrapper proxy that records calls before forwarding them to target"""
+        return RecordingWrapper(target, self)
+
+    def record(self, name, args):
+        payload = pickle.dumps(args, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            method_id = self.ids.get(name)
+            if method_id is None:
+                method_id = len(self.ids) + 1
+                self.ids[name] = method_id
+                encoded = name.encode()
+                self.file.write(RECORD.pack(0.0, DEFINE, len(encoded)) + encoded)
+            self.file.write(RECORD.pack(time.time(), method_id, len(payload)) + payload)
+            self.pending += 1
+            if self.pending >= FLUSH_EVERY:
+                self.file.flush()
+                self.pending = 0
+
+    def close(self):
+        with self.lock:
+            self.file.flush()
+            self.file.close()
+
+
+class RecordingWrapper:
+    """Stands in for the EWrapper given to EClient; tees each callback to the recorder"""
+
+    def __init__(self, target, recorder):
+        self._target = target
+        self._recorder = recorder
+
+    def __getattr__(self, name):
+        if name not in WRAPPER_METHODS:
+            return getattr(self._target, name)
+        target = self._target
+        record = self._recorder.record
+
+        def recorded(*args):
+            # A recording failure must never cost the live handler its callback
+            try:
+                record(name, args)
+            except Exception as e:
+                logger.error(f"Error recording {name}: {str(e)}")
+            # Looked up per call so handlers swapped at runtime (e.g. by the profiler) are used
+            return getattr(target, name)(*args)
+
+        # Cache so later lookups skip __getattr__
+        self.__dict__[name] = recorded
+        return recorded
+
+
+def _iter_records(path):
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not an IB event log")
+        while True:
+            head = f.read(RECORD.size)
+            if len(head) < RECORD.size:
+                return
+            ts, method_id, length = RECORD.unpack(head)
+            payload = f.read(length)
+            if len(payload) < length:
+                return  # truncated tail from a crash
+            yield ts, method_id, payload
+
+
+def _read_names(path):
+    return [payload.decode() for _, method_id, payload in _iter_records(path) if method_id == DEFINE]
+
+
+class EventReplayer:
+    """Drives wrapper handlers from a recorded event log"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def events(self):
+        """Yield (timestamp, method name, args) in recorded order"""
+        names = {}
+        for ts, method_id, payload in _iter_records(self.path):
+            if method_id == DEFINE:
+                names[len(names) + 1] = payload.decode()
+                continue
+            yield ts, names[method_id], pickle.loads(payload)
+
+    def replay(self, target, speed=None, skip=()):
+        """
+        Call target's handlers for every recorded event.
+        Args:
+            target: Object with EWrapper handlers (usually an IBConnection)
+            speed (float): None replays as fast as possible, 1.0 at original pacing, 2.0 twice as fast
+            skip (iterable): Handler names not to call (e.g. "nextValidId" to keep the strategy thread off)
+        Returns:
+            dict with event counts, errors, elapsed seconds and events per second
+        """
+        skip = set(skip)
+        counts = {}
+        errors = 0
+        handlers = {}
+        first_ts = None
+        start = time.perf_counter()
+        for ts, name, args in self.events():
+            if name in skip:
+                continue
+            if speed:
+                if first_ts is None:
+                    first_ts = ts
+                delay = (ts - first_ts) / speed - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            handler = handlers.get(name)
+            if handler is None:
+                handler = handlers[name] = getattr(target, name)
+            try:
+                handler(*args)
+            except Exception as e:
+                errors += 1
+                logger.error(f"Error replaying {name}: {str(e)}")
+            counts[name] = counts.get(name, 0) + 1
+        elapsed = time.perf_counter() - start
+        total = sum(counts.values())
+        return {
+            "events": total,
+            "errors": errors,
+            "seconds": elapsed,
+            "events_per_sec": total / elapsed if elapsed > 0 else 0.0,
+            "counts": counts,
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Replay a recorded IB event log through IBConnection")
+    parser.add_argument("path")
+    parser.add_argument("--speed", type=float, default=None, help="1.0 = original pacing; omit for max speed")
+    parser.add_argument("--archive-dir", default=None, help="where replayed bars are archived (default: a temp dir)")
+    args = parser.parse_args()
+
+    import tempfile
+    from bar_archive import BarArchive
+    from connection import IBConnection
+    # Data-only connection: no strategy thread, no re-recording, no shared-memory bus.
+    # Replayed bars go to a scratch archive, never the live historical_data directory.
+    app = IBConnection(trading=False)
+    app.data_handler.archive = BarArchive(args.archive_dir or tempfile.mkdtemp(prefix="ib_replay_"))
+    logger.info(f"Replaying into archive {app.data_handler.archive.directory}")
+    stats = EventReplayer(args.path).replay(app, speed=args.speed, skip=("nextValidId",))
+    print(f"{stats['events']} events in {stats['seconds']:.3f}s ({stats['events_per_sec']:.0f}/s), "
+          f"{stats['errors']} errors")
+    for name, count in sorted(stats["counts"].items(), key=lambda kv: -kv[1]):
+        print(f"  {name}: {count}")
@@ -0,0 +1,152 @@
+import time
+import numpy as np
+import pandas as pd
+from config import (
+    logger, SYMBOLS, LEVERAGE, ACCOUNT_CURRENCY, MAX_CURRENCY_EXPOSURE,
+    MAX_MARGIN_UTILIZATION, MAX_VAR_FRACTION, VAR_Z, VAR_HORIZON_BARS, RISK_COV_REFRESH_SECONDS
+)
+
+
+class RiskEngine:
+    """Portfolio-level pre-trade checks on net per-currency exposure, kept as NumPy arrays"""
+
+    def __init__(self, client, symbols=SYMBOLS):
+        self.client = client
+        self.symbols = list(symbols)
+        self.pair_index = {sym: i for i, sym in enumerate(self.symbols)}
+
+        # Currencies in the universe, account currency first
+        currencies = [ACCOUNT_CURRENCY]
+        for sym in self.symbols:
+            for ccy in (sym[:3], sym[3:]):
+                if ccy not in currencies:
+                    currencies.append(ccy)
+        self.currencies = currencies
+        self.ccy_index = {ccy: i for i, ccy in enumerate(currencies)}
+        self.base_idx = np.array([self.ccy_index[sym[:3]] for sym in self.symbols])
+        self.quote_idx = np.array([self.ccy_index[sym[3:]] for sym in self.symbols])
+
+        # Incidence matrix: a long position in a pair is long base, short quote
+        n_pairs, n_ccy = len(self.symbols), len(currencies)
+        self.incidence = np.zeros((n_pairs, n_ccy))
+        self.incidence[np.arange(n_pairs), self.base_idx] = 1.0
+        self.incidence[np.arange(n_pairs), self.quote_idx] = -1.0
+
+        self.units = np.zeros(n_pairs)          # signed base-currency units per pair
+        self.prices = np.full(n_pairs, np.nan)  # latest mid per pair
+        self.rates = np.full(n_ccy, np.nan)     # account-currency value of one unit of each currency
+        self.rates[0] = 1.0
+        self.cov = np.zeros((n_pairs, n_pairs))  # per-bar return covariance of the pairs
+        self.cov_updated = 0.0
+
+    # --- State refresh (once per cycle) ---
+
+    def refresh(self):
+        """Pull positions and prices from the caches and convert to the account currency"""
+        units = np.zeros(len(self.symbols))
+        for sym, i in self.pair_index.items():
+            units[i] = self.client.account_state.get_position(sym)
+        self.units = units
+
+        prices = np.full(len(self.symbols), np.nan)
+        for sym, i in self.pair_index.items():
+            snap = self.client.data_handler.get_snapshot(sym, "M1")
+            if snap is not None:
+                prices[i] = snap.close
+        self.prices = prices
+        self.rates = self._conversion_rates(prices)
+
+        if time.time() - self.cov_updated > RISK_COV_REFRESH_SECONDS:
+            self._update_covariance()
+
+    def _conversion_rates(self, prices):
+        """Propagate account-currency rates through the pair graph"""
+        rates = np.full(len(self.currencies), np.nan)
+        rates[0] = 1.0
+        for _ in range(len(self.currencies)):
+            # base = price * quote, quote = base / price; fmax skips NaN and handles repeated indices
+            derived = np.full(len(self.currencies), np.nan)
+            np.fmax.at(derived, self.base_idx, prices * rates[self.quote_idx])
+            np.fmax.at(derived, self.quote_idx, rates[self.base_idx] / prices)
+            rates = np.where(np.isnan(rates), derived, rates)
+            if not np.isnan(rates).any():
+                break
+        return rates
+
+    def _update_covariance(self):
+        """Estimate the pair return covariance from H1 closes"""
+        try:
+            closes = pd.concat(
+                {sym: self.client.data_handler.get_data(sym, "H1")["close"] for sym in self.symbols}, axis=1
+            ).dropna()
+            returns = np.log(closes.to_numpy(dtype=float))
+            returns = np.diff(returns, axis=0)
+            if len(returns) < 2:
+                return
+            self.cov = np.cov(returns, rowvar=False) * VAR_HORIZON_BARS
+            self.cov_updated = time.time()
+        except Exception as e:
+            logger.error(f"Error updating risk covariance: {str(e)}")
+
+    # --- Checks ---
+
+    def exposures(self, units=None):
+        """Net exposure per currency in the account currency"""
+        units = self.units if units is None else units
+        notional = np.where(units == 0, 0.0, units * self.rates[self.base_idx])
+        return notional @ self.incidence
+
+    def check(self, units, nav):
+        """Return None if a portfolio of units passes every limit, else the reason it fails"""
+        notional = np.where(units == 0, 0.0, units * self.rates[self.base_idx])
+        if np.isnan(notional).any():
+            return "missing prices for conversion"
+
+        # 1. Net per-currency caps (the account currency is the cash leg)
+        exposure = notional @ self.incidence
+        worst = np.argmax(np.abs(exposure[1:])) + 1
+        if abs(exposure[worst]) > MAX_CURRENCY_EXPOSURE * nav:
+            return f"{self.currencies[worst]} exposure {exposure[worst]:.0f} over cap"
+
+        # 2. Margin at LEVERAGE
+        margin = np.abs(notional).sum() / LEVERAGE
+        if margin > MAX_MARGIN_UTILIZATION * nav:
+            return f"margin {margin:.0f} over {MAX_MARGIN_UTILIZATION:.0%} of equity"
+
+        # 3. Correlation-adjusted VaR
+        var = VAR_Z * np.sqrt(max(notional @ self.cov @ notional, 0.0))
+        if var > MAX_VAR_FRACTION * nav:
+            return f"VaR {var:.0f} over {MAX_VAR_FRACTION:.0%} of equity"
+        return None
+
+    def check_order(self, symbol, direction, qty, units=None, nav=None):
+        """Pre-trade check for one order on top of the current (or given) positions"""
+        units = self.units if units is None else units
+        nav = nav if nav is not None else self.client.account_state.net_liquidation(1000)
+        candidate = units.copy()
+        candidate[self.pair_index[symbol]] += qty if direction == "BUY" else -qty
+        return self.check(candidate, nav)
+
+    def filter_signals(self, signals):
+        """
+        Check one cycle's signals together, in order, each on top of those already accepted.
+        Accepted signals keep their "quantity", or get one from OrderManager sizing.
+        """
+        self.refresh()
+        nav = self.client.account_state.net_liquidation(1000)
+        units = self.units.copy()
+        accepted = []
+        for signal in signals:
+            sym, direction = signal["symbol"], signal["direction"]
+            if sym not in self.pair_index:
+                continue
+            qty = signal.get("quantity")
+            if qty is None:
+                qty, _, _ = self.client.order_manager.calculate_position_size(sym)
+            reason = self.check_order(sym, direction, qty, units, nav)
+            if reason:
+                logger.info(f"Risk check rejected {direction} {sym} x{qty}: {reason}")
+                continue
+            units[self.pair_index[sym]] += qty if direction == "BUY" else -qty
+            accepted.append(dict(signal, quantity=qty))
+        return accepted
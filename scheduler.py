@@ -0,0 +1,274 @@
+from collections import deque
+from threading import Condition, Thread
+import heapq
+import itertools
+import time
+
+from config import logger, PACING_LIMITS, HISTORICAL_PER_CONTRACT_LIMIT
+
+# Request priorities (lower is sent first)
+PRIORITY_LIVE = 0       # gaps in data the strategy is trading on
+PRIORITY_BACKFILL = 1   # initial history loads
+PRIORITY_RESEARCH = 2   # deep history for datasets
+
+# How far past a blocked queue head the scheduler looks for a sendable request
+LOOKAHEAD = 32
+
+
+class TokenBucket:
+    """Classic token bucket. refill_per_sec=0 makes it a counting semaphore (e.g. market data lines)."""
+
+    def __init__(self, capacity, refill_per_sec):
+        self.capacity = capacity
+        self.refill_per_sec = refill_per_sec
+        self._tokens = float(capacity)
+        self._stamp = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.refill_per_sec:
+            self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.refill_per_sec)
+        self._stamp = now
+
+    @property
+    def tokens(self):
+        self._refill()
+        return self._tokens
+
+    def try_acquire(self, n=1):
+        self._refill()
+        if self._tokens >= n:
+            self._tokens -= n
+            return True
+        return False
+
+    def release(self, n=1):
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens + n)
+
+    def drain(self):
+        """Empty the bucket, e.g. after IB reported a pacing violation"""
+        self._refill()
+        self._tokens = 0.0
+
+    def time_until(self, n=1):
+        """Seconds until n tokens are available (None if they never will be without a release)"""
+        self._refill()
+        if self._tokens >= n:
+            return 0.0
+        if not self.refill_per_sec:
+            return None
+        return (n - self._tokens) / self.refill_per_sec
+
+
+class SlidingWindowLimiter:
+    """
+    At most `capacity` acquisitions in any `window` seconds, the way IB counts requests.
+    Unlike a token bucket that starts full, it never admits more than capacity per window.
+    """
+
+    def __init__(self, capacity, window):
+        self.capacity = capacity
+        self.window = window
+        self._sent = deque()  # monotonic times of acquisitions still inside the window
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.window
+        while self._sent and self._sent[0] <= cutoff:
+            self._sent.popleft()
+
+    @property
+    def tokens(self):
+        self._expire()
+        return float(self.capacity - len(self._sent))
+
+    def try_acquire(self, n=1):
+        self._expire()
+        if len(self._sent) + n > self.capacity:
+            return False
+        now = time.monotonic()
+        self._sent.extend([now] * n)
+        return True
+
+    def release(self, n=1):
+        for _ in range(min(n, len(self._sent))):
+            self._sent.pop()
+
+    def drain(self):
+        """Treat the whole window as used, e.g. after IB reported a pacing violation"""
+        self._expire()
+        now = time.monotonic()
+        self._sent.extend([now] * (self.capacity - len(self._sent)))
+
+    def time_until(self, n=1):
+        """Seconds until n more acquisitions fit in the window"""
+        self._expire()
+        excess = len(self._sent) + n - self.capacity
+        if excess <= 0:
+            return 0.0
+        if excess > len(self._sent):
+            return None
+        return max(0.0, self._sent[excess - 1] + self.window - time.monotonic())
+
+
+class RequestScheduler:
+    """Sends IB requests through per-limit-class rate limiters, in priority order, without duplicates"""
+
+    def __init__(self, can_send=lambda: True):
+        self.can_send = can_send
+        self.buckets = {
+            # Rate limits count requests in a sliding window; window 0 is a plain line limit
+            name: SlidingWindowLimiter(capacity, window) if window else TokenBucket(capacity, 0)
+            for name, (capacity, window) in PACING_LIMITS.items()
+        }
+        self.contract_buckets = {}  # (limit_class, contract_key) -> SlidingWindowLimiter
+        self.queues = {name: [] for name in self.buckets}
+        self.pending = {}    # key -> request, queued or in flight
+        self.counter = itertools.count()
+        self.cond = Condition()
+        Thread(target=self._run, daemon=True).start()
+
+    def submit(self, limit_class, key, send, priority=PRIORITY_BACKFILL, contract_key=None):
+        """
+        Queue a request. Returns False if an identical request is already pending.
+        Args:
+            limit_class (str): One of PACING_LIMITS keys
+            key (hashable): Identity of the request, used for deduplication
+            send (callable): Issues the request to IB
+            priority (int): PRIORITY_* constant
+            contract_key (hashable): Instrument key for per-contract pacing
+        """
+        with self.cond:
+            if key in self.pending:
+                existing = self.pending[key]
+                # A more urgent duplicate promotes the queued request
+                if not existing["sent"] and priority < existing["priority"]:
+                    existing["priority"] = priority
+                    heapq.heappush(self.queues[existing["limit_class"]], (priority, next(self.counter), key))
+                    self.cond.notify()
+                return False
+            request = {
+                "limit_class": limit_class, "key": key, "send": send, "priority": priority,
+                "contract_key": contract_key, "sent": False,
+            }
+            self.pending[key] = request
+            heapq.heappush(self.queues[limit_class], (priority, next(self.counter), key))
+            self.cond.notify()
+            return True
+
+    def complete(self, key, release=False):
+        """Mark a request finished. release=True returns its token (market data line cancelled)."""
+        with self.cond:
+            request = self.pending.pop(key, None)
+            if release and request is not None:
+                self.buckets[request["limit_class"]].release()
+                self.cond.notify()
+
+    def cancel(self, key):
+        """Drop a request. Returns True if it was already sent, so the caller must also cancel it at IB."""
+        with self.cond:
+            request = self.pending.pop(key, None)
+            return request is not None and request["sent"]
+
+    def forget_sent(self, kinds):
+        """
+        Drop requests already sent whose key starts with one of kinds. Their answers were lost
+        with the old socket; dropping them lets the resubscribe after a reconnect go out again.
+        Returns:
+            The dropped keys
+        """
+        with self.cond:
+            dropped = [key for key, request in self.pending.items() if request["sent"] and key[0] in kinds]
+            for key in dropped:
+                del self.pending[key]
+            return dropped
+
+    def retry(self, key):
+        """Re-queue a request that IB rejected (e.g. pacing violation) and back off its class"""
+        with self.cond:
+            request = self.pending.get(key)
+            if request is None:
+                return
+            limit_class = request["limit_class"]
+            self.buckets[limit_class].drain()
+            request["sent"] = False
+            heapq.heappush(self.queues[limit_class], (request["priority"], next(self.counter), key))
+            logger.warning(f"Pacing violation on {limit_class}, re-queued {key}")
+            self.cond.notify()
+
+    def is_pending(self, key):
+        return key in self.pending
+
+    def tokens_remaining(self):
+        """Tokens currently available per limit class"""
+        with self.cond:
+            return {name: bucket.tokens for name, bucket in self.buckets.items()}
+
+    def queue_depth(self):
+        with self.cond:
+            return {name: len(queue) for name, queue in self.queues.items()}
+
+    def wake(self):
+        """Re-check queues, e.g. after the connection came back"""
+        with self.cond:
+            self.cond.notify()
+
+    def _contract_bucket(self, limit_class, contract_key):
+        if contract_key is None or limit_class != "historical":
+            return None
+        bucket = self.contract_buckets.get((limit_class, contract_key))
+        if bucket is None:
+            capacity, window = HISTORICAL_PER_CONTRACT_LIMIT
+            bucket = SlidingWindowLimiter(capacity, window)
+            self.contract_buckets[(limit_class, contract_key)] = bucket
+        return bucket
+
+    def _next_ready(self):
+        """Pop the best sendable request across classes, or return the seconds to wait"""
+        wait = None
+        for limit_class, queue in self.queues.items():
+            bucket = self.buckets[limit_class]
+            delay = bucket.time_until()
+            if delay is None or delay > 0:
+                if queue and delay is not None:
+                    wait = delay if wait is None else min(wait, delay)
+                continue
+            skipped = []
+            found = None
+            while queue and len(skipped) < LOOKAHEAD:
+                entry = heapq.heappop(queue)
+                request = self.pending.get(entry[2])
+                # Dropped (completed/cancelled) or stale entries from a priority change or retry
+                if request is None or request["sent"] or request["priority"] != entry[0]:
+                    continue
+                contract_bucket = self._contract_bucket(limit_class, request["contract_key"])
+                if contract_bucket is not None and not contract_bucket.try_acquire():
+                    skipped.append(entry)
+                    delay = contract_bucket.time_until()
+                    wait = delay if wait is None else min(wait, delay)
+                    continue
+                found = request
+                break
+            for entry in skipped:
+                heapq.heappush(queue, entry)
+            if found is not None:
+                bucket.try_acquire()
+                found["sent"] = True
+                return found, None
+        return None, wait
+
+    def _run(self):
+        while True:
+            with self.cond:
+                if not self.can_send():
+                    self.cond.wait(1)
+                    continue
+                request, wait = self._next_ready()
+                if request is None:
+                    self.cond.wait(wait)
+                    continue
+            try:
+                request["send"]()
+            except Exception as e:
+                logger.error(f"Error sending request {request['key']}: {str(e)}")
+                self.complete(request["key"])
@@ -0,0 +1,170 @@
+from threading import Event, Thread
+import time
+
+from config import logger, SYMBOLS, RECONNECT_BACKOFF_INITIAL, RECONNECT_BACKOFF_MAX, CONNECT_MAX_ATTEMPTS
+
+# Error codes that mean the API socket is gone and we must reconnect
+DISCONNECT_ERRORS = [502, 504, 1300]
+# TWS lost its connection to IB; the socket stays open, wait for 1101/1102
+CONNECTIVITY_LOST = 1100
+# Connectivity restored, market data subscriptions were lost
+CONNECTIVITY_RESTORED_DATA_LOST = 1101
+# Connectivity restored, subscriptions were maintained
+CONNECTIVITY_RESTORED = 1102
+
+
+class SessionManager:
+    """Keeps an IBConnection connected and restores its state after every reconnect"""
+
+    def __init__(self, app, host, port, client_id=0):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.client_id = client_id
+        self.api_thread = None
+        self.lost = Event()       # set when the socket must be re-established
+        self.stopped = Event()
+        self.connected_once = False
+        self.disconnected_at = None
+        app.session = self
+
+    def start(self, timeout=30):
+        """Connect and start watching the session. Returns False after CONNECT_MAX_ATTEMPTS failures."""
+        if not self._connect_with_backoff(timeout):
+            return False
+        Thread(target=self._watch, daemon=True).start()
+        return True
+
+    def stop(self):
+        """Stop reconnecting and disconnect"""
+        self.stopped.set()
+        self.lost.set()
+        self.app.disconnect()
+
+    # --- Signals from IBConnection callbacks ---
+
+    def on_error(self, errorCode):
+        """React to connectivity error codes"""
+        if errorCode in DISCONNECT_ERRORS:
+            logger.warning(f"Session lost (code {errorCode}), reconnecting")
+            self._mark_lost()
+        elif errorCode == CONNECTIVITY_LOST:
+            logger.warning("TWS lost connectivity to IB, waiting for it to be restored")
+            self.disconnected_at = self.disconnected_at or time.time()
+        elif errorCode == CONNECTIVITY_RESTORED_DATA_LOST:
+            logger.info("Connectivity restored, data lost. Resubscribing")
+            self.restore(socket_open=True)
+        elif errorCode == CONNECTIVITY_RESTORED:
+            logger.info("Connectivity restored, data maintained")
+            self._log_recovery()
+
+    def on_connection_closed(self):
+        """The socket closed (TWS restart, network drop or our own disconnect)"""
+        if not self.stopped.is_set():
+            logger.warning("Connection closed, reconnecting")
+            self._mark_lost()
+
+    def on_ready(self):
+        """nextValidId arrived. Restore subscriptions when this is a reconnect"""
+        if self.connected_once:
+            # Requests in flight on the old socket will never be answered
+            dropped = self.app.scheduler.forget_sent(("historical", "contract_details"))
+            if dropped:
+                logger.info(f"Dropped {len(dropped)} requests lost with the old connection")
+        # Only missing or stale contracts are looked up
+        self.app.contracts.resolve_all(SYMBOLS)
+        if self.connected_once:
+            Thread(target=self.restore, daemon=True).start()
+        self.connected_once = True
+
+    # --- Recovery ---
+
+    def restore(self, socket_open=False):
+        """
+        Re-issue subscriptions, reconcile orders and backfill missing bars.
+        Args:
+            socket_open (bool): True after error 1101. The old streams still hold their
+                request ids on the open socket, so they are cancelled before re-requesting,
+                and one-shot requests in flight are left to finish.
+        """
+        try:
+            if socket_open:
+                self.app.account_state.unsubscribe()
+                self.app.historical_data.cancel_streams()
+                self.app.realtime_data.cancel_streams()
+            self.app.account_state.subscribe()
+            self.app.historical_data.resubscribe()
+            self.app.realtime_data.resubscribe()
+            self.app.order_manager.reconcile()
+            if not socket_open:
+                self.app.downloader.restart_in_flight()
+                self.app.async_client.restart_in_flight()
+            self.app.scheduler.wake()
+            self._log_recovery()
+        except Exception as e:
+            logger.error(f"Error restoring session: {str(e)}")
+
+    def _log_recovery(self):
+        if self.disconnected_at is not None:
+            logger.info(f"Session recovered in {time.time() - self.disconnected_at:.1f}s")
+            self.disconnected_at = None
+
+    def _mark_lost(self):
+        self.disconnected_at = self.disconnected_at or time.time()
+        self.lost.set()
+
+    def _watch(self):
+        """Reconnect whenever the session is lost"""
+        while not self.stopped.is_set():
+            self.lost.wait()
+            if self.stopped.is_set():
+                break
+            self.app.connection_ready.clear()
+            if self.app.isConnected():
+                self.app.disconnect()
+            if not self._connect_with_backoff() and not self.stopped.is_set():
+                logger.error(f"Could not reconnect after {CONNECT_MAX_ATTEMPTS} attempts, shutting down")
+                self.app.done.set()
+                break
+
+    def is_stale_reader(self, thread):
+        """True for a message loop left over from a previous socket"""
+        return thread.name.startswith("ib-reader") and thread is not self.api_thread
+
+    def _connect_with_backoff(self, timeout=30, max_attempts=CONNECT_MAX_ATTEMPTS):
+        """Connect, retrying with exponential backoff until connected, stopped or out of attempts"""
+        delay = RECONNECT_BACKOFF_INITIAL
+        attempt = 1
+        while not self.stopped.is_set() and (not max_attempts or attempt <= max_attempts):
+            try:
+                logger.info(f"Connecting to {self.host}:{self.port} (attempt {attempt})")
+                # The previous message loop exits once the socket is closed
+                if self.api_thread is not None:
+                    self.api_thread.join(5)
+                    if self.api_thread.is_alive():
+                        # Its final disconnect() is ignored by IBConnection once a new loop runs
+                        logger.warning("Previous message loop still running, its disconnect will be ignored")
+                self.lost.clear()
+                self.app.connect(self.host, self.port, clientId=self.client_id)
+                # A refused connection reports 502 and returns without raising; don't wait for nextValidId
+                if not self.app.isConnected():
+                    logger.warning("Connection refused")
+                else:
+                    self.api_thread = Thread(target=self.app.run, daemon=True, name=f"ib-reader-{attempt}")
+                    self.api_thread.start()
+
+                    if self.app.connection_ready.wait(timeout):
+                        logger.info("Successfully connected to IB API")
+                        return True
+                    logger.warning("Connection timeout")
+                    self.app.disconnect()
+            except Exception as e:
+                logger.error(f"Connection error: {str(e)}")
+
+            if max_attempts and attempt >= max_attempts:
+                break
+            logger.info(f"Retrying in {delay}s")
+            self.stopped.wait(delay)
+            delay = min(delay * 2, RECONNECT_BACKOFF_MAX)
+            attempt += 1
+        return False
@@ -5,9 +5,38 @@ from config import (
     RSI_OVERBOUGHT, RSI_OVERSOLD, RSI_BULLISH, RSI_BEARISH
 )
 
-class TradingStrategy:
-    def __init__(self, data_handler):
+class Strategy:
+    """Base class for strategies run against a shared DataHandler"""
+    
+    # Per timeframe: indicators the strategy reads and the bars it needs, e.g.
+    # {"M1": {"indicators": ["rsi"], "lookback": 30}}
+    REQUIREMENTS = {}
+    
+    def requirements(self):
+        """Indicators and lookbacks this strategy needs per timeframe"""
+        return self.REQUIREMENTS
+    
+    def calculate_signals(self, open_orders):
+        raise NotImplementedError
+
+
+# Entry timeframes read the full signal set, trend timeframes only the EMAs
+ENTRY_INDICATORS = {"indicators": ["ema_fast", "ema_slow", "histogram", "rsi", "bb_upper", "bb_lower"], "lookback": 30}
+TREND_INDICATORS = {"indicators": ["ema_fast", "ema_slow"], "lookback": SLOW_EMA}
+
+
+class TradingStrategy(Strategy):
+    REQUIREMENTS = {
+        "M1": ENTRY_INDICATORS,
+        "M15": ENTRY_INDICATORS,
+        "H1": ENTRY_INDICATORS,
+        "H4": TREND_INDICATORS,
+        "D1": TREND_INDICATORS,
+    }
+    
+    def __init__(self, data_handler, max_open=MAX_OPEN):
         self.data_handler = data_handler
+        self.max_open = max_open
         self.positions = {sym: None for sym in SYMBOLS}  # Track positions by symbol
     
     def calculate_signals(self, open_orders):
@@ -15,8 +44,8 @@ class TradingStrategy:
         signals = []
         
         # Check if we've reached maximum open positions
-        if open_orders >= MAX_OPEN:
-            logger.info(f"Maximum open positions ({MAX_OPEN}) reached, skipping new orders")
+        if open_orders >= self.max_open:
+            logger.info(f"Maximum open positions ({self.max_open}) reached, skipping new orders")
             return signals
         
         # Process each symbol
@@ -29,8 +58,8 @@ class TradingStrategy:
             # Check if we have enough data for all timeframes
             has_all_data = True
             for tf in TIMEFRAMES:
-                df = self.data_handler.get_data(sym, tf)
-                if len(df) < SLOW_EMA:
+                snap = self.data_handler.get_snapshot(sym, tf)
+                if snap is None or snap.bars < SLOW_EMA:
                     logger.warning(f"Not enough data for {sym} on {tf}, skipping")
                     has_all_data = False
                     break
@@ -44,7 +73,7 @@ class TradingStrategy:
                 signals.append(signal)
                 
                 # Only take one signal at a time to avoid overtrading
-                if len(signals) + open_orders >= MAX_OPEN:
+                if len(signals) + open_orders >= self.max_open:
                     break
                 
         return signals
@@ -52,14 +81,14 @@ class TradingStrategy:
     def _calculate_signal_for_symbol(self, symbol):
         """Calculate trading signal for a specific symbol using multiple timeframes"""
         try:
-            # Get data for different timeframes
-            m1_data = self.data_handler.get_data(symbol, "M1")
-            m15_data = self.data_handler.get_data(symbol, "M15")
-            h1_data = self.data_handler.get_data(symbol, "H1")
-            h4_data = self.data_handler.get_data(symbol, "H4")
-            d1_data = self.data_handler.get_data(symbol, "D1")
-            
-            if m1_data.empty or m15_data.empty or h1_data.empty or h4_data.empty or d1_data.empty:
+            # Get the latest indicator snapshots for different timeframes
+            m1_data = self.data_handler.get_snapshot(symbol, "M1")
+            m15_data = self.data_handler.get_snapshot(symbol, "M15")
+            h1_data = self.data_handler.get_snapshot(symbol, "H1")
+            h4_data = self.data_handler.get_snapshot(symbol, "H4")
+            d1_data = self.data_handler.get_snapshot(symbol, "D1")
+            
+            if m1_data is None or m15_data is None or h1_data is None or h4_data is None or d1_data is None:
                 return None
             
             # Determine main trend from higher timeframes
@@ -83,7 +112,7 @@ class TradingStrategy:
             
             # Only generate a signal if M1 shows an entry and M15/H1 confirm the trend
             if m1_signal and m15_signal == main_trend and h1_signal == main_trend:
-                price = m1_data['close'].iloc[-1]
+                price = m1_data.close
                 logger.info(f"{symbol}: {main_trend} signal confirmed across multiple timeframes")
                 return {"symbol": symbol, "direction": main_trend, "price": price}
                 
@@ -93,13 +122,13 @@ class TradingStrategy:
             logger.error(f"Error calculating signal for {symbol}: {str(e)}")
             return None
     
-    def _determine_trend(self, df):
+    def _determine_trend(self, snap):
         """Determine the trend based on EMAs and MACD"""
-        if df.empty or 'ema_fast' not in df.columns or 'ema_slow' not in df.columns:
+        if snap is None:
             return "neutral"
             
-        fast = df['ema_fast'].iloc[-1]
-        slow = df['ema_slow'].iloc[-1]
+        fast = snap.ema_fast
+        slow = snap.ema_slow
         
         if fast > slow:
             return "BUY"
@@ -108,12 +137,12 @@ class TradingStrategy:
         else:
             return "neutral"
     
-    def _check_entry_signal(self, df, trend_direction):
-        if df.empty or len(df) < 30:
+    def _check_entry_signal(self, snap, trend_direction):
+        if snap is None or snap.bars < 30:
             return None
             
         # Get latest values
-        rsi = df['rsi'].iloc[-1]
+        rsi = snap.rsi
         
         # Enhanced RSI conditions
         if trend_direction == "BUY" and rsi > 50:
@@ -122,13 +151,13 @@ class TradingStrategy:
             return None
             
         # Existing indicator calculations
-        fast_ema = df['ema_fast'].iloc[-1]
-        slow_ema = df['ema_slow'].iloc[-1]
-        fast_ema_prev = df['ema_fast'].iloc[-2]
-        macd_hist = df['histogram'].iloc[-1]
-        price = df['close'].iloc[-1]
-        bb_upper = df['bb_upper'].iloc[-1]
-        bb_lower = df['bb_lower'].iloc[-1]
+        fast_ema = snap.ema_fast
+        slow_ema = snap.ema_slow
+        fast_ema_prev = snap.prev_ema_fast
+        macd_hist = snap.histogram
+        price = snap.close
+        bb_upper = snap.bb_upper
+        bb_lower = snap.bb_lower
         
         # Buy signal conditions
         if trend_direction == "BUY":
@@ -142,7 +171,7 @@ class TradingStrategy:
             bb_signal = price <= bb_lower
             
             # 4. MACD
-            macd_signal = macd_hist > 0 and df['histogram'].iloc[-2] < macd_hist
+            macd_signal = macd_hist > 0 and snap.prev_histogram < macd_hist
             
             # Combined signal
             if (ma_signal or bb_signal) and rsi_signal and macd_signal:
@@ -160,16 +189,14 @@ class TradingStrategy:
             bb_signal = price >= bb_upper
             
             # 4. MACD
-            macd_signal = macd_hist < 0 and df['histogram'].iloc[-2] > macd_hist
+            macd_signal = macd_hist < 0 and snap.prev_histogram > macd_hist
             
             # Combined signal
             if (ma_signal or bb_signal) and rsi_signal and macd_signal:
                 return "SELL"
                 
         # Add Bollinger Band touch detection
-        current_price = df['close'].iloc[-1]
-        bb_upper = df['bb_upper'].iloc[-1]
-        bb_lower = df['bb_lower'].iloc[-1]
+        current_price = snap.close
         
         if trend_direction == "BUY":
             bb_signal = current_price <= bb_lower
@@ -0,0 +1,168 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from threading import Lock
+from config import logger, MAX_OPEN, STRATEGY_WORKERS, STRATEGY_TIMEOUT
+
+
+class StrategySlot:
+    """One strategy instance with its own virtual sub-account and position book"""
+
+    def __init__(self, name, strategy, allocation=1.0, max_open=MAX_OPEN):
+        self.name = name
+        self.strategy = strategy
+        self.allocation = allocation  # share of net liquidation this strategy sizes against
+        self.max_open = max_open
+        self.positions = {}  # symbol -> {"direction", "quantity", "entry_price", "order_id"}
+
+    @property
+    def open_count(self):
+        return len(self.positions)
+
+
+class StrategyRunner:
+    """
+    Evaluates every registered strategy concurrently against the shared DataHandler,
+    then nets their signals per symbol and sends one tagged order per symbol.
+
+    Orders carry the contributing slot names in orderRef ("trend+meanrev"), so fills and
+    closes are booked back to each slot's virtual position. Each contributing slot is
+    booked its share of the netted quantity, so the slot books add up to the real position.
+
+    OrderManager holds one position (with its SL/TP bracket) per symbol, so while any slot
+    holds a symbol, signals of every slot for that symbol are dropped at the netting step.
+    """
+
+    def __init__(self, client, max_workers=STRATEGY_WORKERS):
+        self.client = client
+        self.slots = {}
+        self.lock = Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="strategy")
+
+    def add(self, name, strategy, allocation=1.0, max_open=MAX_OPEN):
+        """Register a strategy; its indicator requirements are added to the shared DataHandler plans"""
+        if name in self.slots:
+            raise ValueError(f"Strategy slot {name} already registered")
+        if "+" in name:
+            raise ValueError("Strategy slot names cannot contain '+' (used to join orderRef tags)")
+        self.slots[name] = StrategySlot(name, strategy, allocation, max_open)
+        self.client.data_handler.register_strategy(strategy)
+        logger.info(f"Registered strategy {name} ({type(strategy).__name__}, allocation {allocation:.0%}, max open {max_open})")
+
+    def run_cycle(self):
+        """Evaluate all slots, net their signals and place the resulting orders"""
+        # Step 1: evaluate every slot on the worker pool
+        futures = {
+            name: self.executor.submit(slot.strategy.calculate_signals, slot.open_count)
+            for name, slot in self.slots.items()
+        }
+        tagged = []
+        for name, future in futures.items():
+            slot = self.slots[name]
+            try:
+                signals = future.result(timeout=STRATEGY_TIMEOUT) or []
+            except FutureTimeout:
+                logger.error(f"Strategy {name} did not finish within {STRATEGY_TIMEOUT}s, skipping its signals")
+                continue
+            except Exception as e:
+                logger.error(f"Error in strategy {name}: {str(e)}")
+                continue
+            # Per-slot position limit and one position per symbol within a slot
+            room = slot.max_open - slot.open_count
+            for signal in signals:
+                if room <= 0:
+                    break
+                if signal["symbol"] in slot.positions:
+                    continue
+                qty = self._slot_quantity(slot, signal["symbol"])
+                tagged.append(dict(signal, strategy=name, quantity=qty))
+                room -= 1
+
+        # Step 2: net across slots and run the portfolio risk checks on the net orders
+        held = {sym for sym, position in self.client.order_manager.positions.items() if position}
+        blocked = [s for s in tagged if s["symbol"] in held]
+        for signal in blocked:
+            logger.info(f"{signal['symbol']}: {signal['strategy']} signal dropped, position already open for this symbol")
+        orders = self.client.risk_engine.filter_signals(self.net([s for s in tagged if s["symbol"] not in held]))
+
+        # Step 3: send, then book each contributing slot's virtual position
+        for order in orders:
+            order_id = self.client.order_manager.place_order(
+                order["symbol"], order["direction"], order["price"], order["quantity"], tag=order["tag"]
+            )
+            if order_id is None:
+                continue
+            for signal, qty in zip(order["signals"], self._shares(order)):
+                self._book(signal, qty, order_id)
+        return orders
+
+    def net(self, signals):
+        """
+        Combine tagged signals per symbol into one order. Opposite directions offset each
+        other: the larger side is sent for the difference, the offset signals are dropped.
+        """
+        by_symbol = {}
+        for signal in signals:
+            by_symbol.setdefault(signal["symbol"], []).append(signal)
+
+        orders = []
+        for sym, group in by_symbol.items():
+            net_qty = sum(s["quantity"] if s["direction"] == "BUY" else -s["quantity"] for s in group)
+            if net_qty == 0:
+                logger.info(f"{sym}: signals from {', '.join(s['strategy'] for s in group)} net to zero, no order")
+                continue
+            direction = "BUY" if net_qty > 0 else "SELL"
+            kept = [s for s in group if s["direction"] == direction]
+            dropped = [s["strategy"] for s in group if s["direction"] != direction]
+            if dropped:
+                logger.info(f"{sym}: {direction} netted against {', '.join(dropped)}")
+            orders.append({
+                "symbol": sym,
+                "direction": direction,
+                "price": kept[0]["price"],
+                "quantity": self.client.contracts.round_quantity(sym, abs(net_qty)),
+                "tag": "+".join(s["strategy"] for s in kept),
+                "signals": kept,
+            })
+        return orders
+
+    def _slot_quantity(self, slot, sym):
+        """Order size for a slot: full-account sizing scaled to the slot's allocation"""
+        qty, _, _ = self.client.order_manager.calculate_position_size(sym)
+        return self.client.contracts.round_quantity(sym, max(1, int(qty * slot.allocation)))
+
+    def _shares(self, order):
+        """Split an order's (netted, risk-adjusted) quantity across its signals pro rata"""
+        requested = sum(s["quantity"] for s in order["signals"])
+        shares = [int(s["quantity"] * order["quantity"] // requested) for s in order["signals"][:-1]]
+        # The last slot takes the remainder so the books sum to the quantity actually sent
+        return shares + [order["quantity"] - sum(shares)]
+
+    def _book(self, signal, qty, order_id):
+        slot = self.slots[signal["strategy"]]
+        position = {
+            "direction": signal["direction"],
+            "quantity": qty,
+            "entry_price": signal["price"],
+            "order_id": order_id,
+        }
+        with self.lock:
+            slot.positions[signal["symbol"]] = position
+        slot.strategy.update_position(signal["symbol"], position)
+
+    def on_position_closed(self, sym, tag=None):
+        """Close the virtual positions of the slots named in an order's tag (all slots if untagged)"""
+        names = tag.split("+") if tag else list(self.slots)
+        for name in names:
+            slot = self.slots.get(name)
+            if slot is None:
+                continue
+            with self.lock:
+                slot.positions.pop(sym, None)
+            slot.strategy.update_position(sym, "closed")
+
+    def positions(self):
+        """Virtual positions per slot"""
+        with self.lock:
+            return {name: dict(slot.positions) for name, slot in self.slots.items()}
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
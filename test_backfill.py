@@ -0,0 +1,44 @@
+# Gap backfill sizing after a reconnect, with the host clock pinned to a non-UTC zone.
+# Run with: python -m pytest test_backfill.py
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from zoneinfo import ZoneInfo
+import time
+
+import pytest
+
+from bar_archive import bar_time_to_epoch
+from connection import IBConnection
+
+TZ = "America/New_York"
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("TZ", TZ)
+    time.tzset()
+    app = IBConnection(trading=False)
+    yield app
+    app.metrics.stop()
+    monkeypatch.undo()
+    time.tzset()
+
+
+@pytest.mark.parametrize("suffix", [True, False])
+def test_gap_after_two_hour_outage(app, suffix):
+    # Last M1 bar opened two hours ago, as TWS would send it with or without a zone suffix
+    opened = datetime.now(ZoneInfo(TZ)).replace(second=0, microsecond=0) - timedelta(hours=2)
+    date = opened.strftime("%Y%m%d %H:%M:%S") + (f" {TZ}" if suffix else "")
+    assert bar_time_to_epoch(date) == int(opened.timestamp())
+
+    app.wrapper.historicalData(0, SimpleNamespace(date=date, open=1.1, high=1.2, low=1.0, close=1.15, volume=0))
+    symbol = next(iter(app.data_handler.data))
+    duration = app.historical_data._gap_duration(symbol, "M1")
+    seconds = int(duration.split()[0])
+    assert duration.endswith(" S")
+    assert 2 * 3600 + 60 <= seconds <= 2 * 3600 + 180
+
+
+def test_formatdate_2_epoch_is_unchanged(app):
+    assert bar_time_to_epoch("1700000000") == 1700000000
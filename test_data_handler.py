@@ -0,0 +1,53 @@
+# DataHandler memory budget eviction: indicators after trimming stay close to the untrimmed ones.
+# Run with: python -m pytest test_data_handler.py
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from config import SYMBOLS
+from data_handler import DataHandler, IndicatorSnapshot
+from indicators import _random_bars
+
+
+def feed(handler, closes, start=0):
+    for i, close in enumerate(closes, start):
+        bar = SimpleNamespace(date=str(1700000000 + 60 * i), open=close, high=close, low=close, close=close, volume=0)
+        handler.process_historical_data(0, bar)  # first symbol, M1
+
+
+def test_eviction_keeps_indicators_within_tolerance(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    closes = _random_bars(1, 320, seed=3)[0][0]
+    full, trimmed = DataHandler(), DataHandler()
+    feed(full, closes[:300])
+    feed(trimmed, closes[:300])
+
+    trimmed.memory_budget = 1  # evict every store down to its floor
+    trimmed._enforce_memory_budget()
+    store = trimmed.data[SYMBOLS[0]]["M1"]
+    assert len(store) == trimmed.plans["M1"].settle_bars < 300
+
+    feed(full, closes[300:], 300)
+    feed(trimmed, closes[300:], 300)
+    expected = full.get_snapshot(SYMBOLS[0], "M1")
+    got = trimmed.get_snapshot(SYMBOLS[0], "M1")
+    for col in IndicatorSnapshot.COLUMNS:
+        # EMAs drift by at most ~exp(-2 * EMA_SETTLE_SPANS) of the price range; windowed ones not at all
+        assert getattr(got, col) == pytest.approx(getattr(expected, col), rel=0, abs=1e-6), col
+
+
+def test_bars_are_published_during_warmup(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    handler = DataHandler()
+    published = []
+    handler.publisher = SimpleNamespace(publish=lambda sym, tf, time, values: published.append(values))
+    closes = _random_bars(1, handler.plans["M1"].min_bars + 1)[0][0]
+    feed(handler, closes)
+
+    # One record per bar from the first one; indicators only once the plan has warmed up
+    assert len(published) == len(closes)
+    first, last = published[0], published[-1]
+    assert first["close"] == closes[0]
+    assert all(np.isnan(first.get(name, np.nan)) for name in handler.plans["M1"].outputs)
+    assert not any(np.isnan(last[name]) for name in handler.plans["M1"].outputs)
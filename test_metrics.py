@@ -0,0 +1,89 @@
+# Stand-in Prometheus scraper: feeds callbacks through the real wrapper chain, serves on
+# an ephemeral port and checks the scraped values. Run with: python -m pytest test_metrics.py
+from types import SimpleNamespace
+from urllib.request import urlopen
+import time
+
+import pytest
+
+from config import SYMBOLS
+from connection import IBConnection
+from metrics import parse_metrics
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # bar archive and profile files stay out of the repo
+    app = IBConnection(trading=False)
+    yield app
+    app.metrics.stop()
+
+
+def scrape(port):
+    with urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+        assert response.status == 200
+        return parse_metrics(response.read().decode())
+
+
+def test_scrape_reports_callback_cycle_order_and_pacing_metrics(app):
+    port = app.metrics.serve(port=0)
+    assert port
+
+    # 30 bars on the first symbol's M1 stream, 12 ticks on a live market data line
+    for i in range(30):
+        bar = SimpleNamespace(date=str(1700000000 + 60 * i), open=1.1, high=1.2, low=1.0, close=1.15, volume=0)
+        app.wrapper.historicalData(0, bar)
+    app.realtime_data.active_subscriptions[1000] = {"symbol": SYMBOLS[1], "timeframe": "M1"}
+    for _ in range(12):
+        app.wrapper.tickPrice(1000, 1, 1.25, None)
+
+    # Two strategy cycles and one order round trip
+    app.metrics.observe_cycle(0.5)
+    app.metrics.observe_cycle(1.5)
+    app.placeOrder(7, app.contracts.get(SYMBOLS[0]), SimpleNamespace())
+    time.sleep(0.05)
+    app.wrapper.orderStatus(7, "Submitted", 0, 1, 0.0, 0, 0, 0.0, 0, "", 0.0)
+    app.wrapper.orderStatus(7, "Submitted", 0, 1, 0.0, 0, 0, 0.0, 0, "", 0.0)  # repeats count once
+
+    samples = scrape(port)
+    window = app.metrics.rates.window
+    assert samples[("ibbot_bars_total", (("symbol", SYMBOLS[0]),))] == 30
+    assert samples[("ibbot_bars_per_second", (("symbol", SYMBOLS[0]),))] == pytest.approx(30 / window)
+    assert samples[("ibbot_ticks_total", (("symbol", SYMBOLS[1]),))] == 12
+    assert samples[("ibbot_ticks_per_second", (("symbol", SYMBOLS[1]),))] == pytest.approx(12 / window)
+    assert 0 < samples[("ibbot_callback_busy_ratio", ())] <= 1
+    assert samples[("ibbot_callback_busy_seconds_total", ())] > 0
+
+    assert samples[("ibbot_strategy_cycle_seconds_count", ())] == 2
+    assert samples[("ibbot_strategy_cycle_seconds_sum", ())] == pytest.approx(2.0)
+    assert samples[("ibbot_strategy_cycle_last_seconds", ())] == pytest.approx(1.5)
+    assert samples[("ibbot_strategy_cycle_max_seconds", ())] == pytest.approx(1.5)
+
+    assert samples[("ibbot_orders_total", (("stage", "submitted"),))] == 1
+    assert samples[("ibbot_orders_total", (("stage", "acknowledged"),))] == 1
+    assert samples[("ibbot_order_status_total", (("status", "Submitted"),))] == 1
+    assert samples[("ibbot_order_ack_seconds_total", ())] >= 0.05
+    assert samples[("ibbot_orders_in_flight", ())] == 1
+
+    assert samples[("ibbot_pacing_tokens_remaining", (("class", "historical"),))] == 60
+    assert samples[("ibbot_pacing_tokens_remaining", (("class", "contract_details"),))] == 50
+    assert samples[("ibbot_pacing_queue_depth", (("class", "historical"),))] == 0
+
+    # A terminal status closes the round trip
+    app.wrapper.orderStatus(7, "Filled", 1, 0, 1.15, 0, 0, 1.15, 0, "", 0.0)
+    samples = scrape(port)
+    assert samples[("ibbot_orders_in_flight", ())] == 0
+    assert samples[("ibbot_order_status_total", (("status", "Filled"),))] == 1
+
+
+def test_unknown_path_is_404(app):
+    port = app.metrics.serve(port=0)
+    with pytest.raises(Exception) as excinfo:
+        urlopen(f"http://127.0.0.1:{port}/other", timeout=5)
+    assert getattr(excinfo.value, "code", None) == 404
+
+
+def test_port_in_use_is_logged_not_raised(app):
+    port = app.metrics.serve(port=0)
+    other = IBConnection(trading=False)
+    assert other.metrics.serve(port=port) is None
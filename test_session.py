@@ -0,0 +1,51 @@
+# Recovery after IB connectivity errors, with the outgoing requests captured instead of sent.
+# Run with: python -m pytest test_session.py
+import pytest
+
+from account_state import ACCOUNT_SUMMARY_REQ_ID, PNL_REQ_ID
+from config import SYMBOLS
+from connection import IBConnection
+from session import SessionManager, CONNECTIVITY_RESTORED_DATA_LOST
+
+CAPTURED = [
+    "reqAccountSummary", "cancelAccountSummary", "reqPositions", "cancelPositions", "reqPnL", "cancelPnL",
+    "reqHistoricalData", "cancelHistoricalData", "reqMktData", "cancelMktData",
+    "reqOpenOrders", "reqExecutions",
+]
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    app = IBConnection(trading=False)
+    app.calls = []
+    for name in CAPTURED:
+        setattr(app, name, lambda *args, name=name, **kwargs: app.calls.append((name, kwargs.get("reqId", args[0] if args else None))))
+    monkeypatch.setattr(app.scheduler, "can_send", lambda: True)
+    yield app
+    app.metrics.stop()
+
+
+def test_data_lost_cancels_streams_before_rerequesting(app):
+    session = SessionManager(app, "127.0.0.1", 0)
+    app.account_state.account = "DU123"
+    app.account_state.subscribe()
+    app.historical_data.subscriptions[0] = {"symbol": SYMBOLS[0], "timeframe": "M1", "bar_size": "1 min"}
+    app.realtime_data.active_subscriptions[1000] = {"symbol": SYMBOLS[0], "timeframe": "M1", "last_update": None}
+    app.calls.clear()
+
+    session.on_error(CONNECTIVITY_RESTORED_DATA_LOST)
+    # resubscribe goes through the scheduler thread
+    for _ in range(200):
+        if ("reqHistoricalData", 0) in app.calls:
+            break
+        app.done.wait(0.01)
+
+    def before(cancel, request):
+        return app.calls.index(cancel) < app.calls.index(request)
+
+    assert before(("cancelAccountSummary", ACCOUNT_SUMMARY_REQ_ID), ("reqAccountSummary", ACCOUNT_SUMMARY_REQ_ID))
+    assert before(("cancelPnL", PNL_REQ_ID), ("reqPnL", PNL_REQ_ID))
+    assert before(("cancelHistoricalData", 0), ("reqHistoricalData", 0))
+    assert before(("cancelMktData", 1000), ("reqMktData", 1000))
+    assert app.calls.count(("reqHistoricalData", 0)) == 1